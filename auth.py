@@ -0,0 +1,75 @@
+from collections.abc import Callable
+from functools import wraps
+from typing import Any
+
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from config import settings
+from database import get_session
+from models import User, user_fields
+from modules.Cache import TTLCache
+from modules.Responses import abort
+
+
+# Current claims version of each user, so most requests are authorized
+# without touching the database. Other workers see changes after the TTL.
+CLAIMS_CACHE = TTLCache(ttl=settings.claims_ttl, maxsize=settings.claims_cache_size)
+_DELETED = -1
+
+
+def claims_for(role: str, tariff: str, version: int) -> dict[str, Any]:
+    """Additional JWT claims for a user with this role, tariff and claims version."""
+    return {"role": role, "tariff": tariff, "cv": version}
+
+
+def update_claims(identity: str, role: str, tariff: str, version: int) -> dict[str, Any]:
+    """Record a role/tariff change, tokens with an older claims version are rejected."""
+    claims = claims_for(role, tariff, version)
+    CLAIMS_CACHE.set(identity, version)
+    return claims
+
+
+def forget_claims(identity: str) -> None:
+    """Record a deleted user, all of their tokens are rejected."""
+    CLAIMS_CACHE.set(identity, _DELETED)
+
+
+def _current_version(identity: str, reload: bool = False) -> int:
+    version = None if reload else CLAIMS_CACHE.get(identity)
+    if version is None:
+        with get_session() as session:
+            user = user_fields(session, identity, User.claims_version)
+        version = user.claims_version if user else _DELETED
+        CLAIMS_CACHE.set(identity, version)
+    return version
+
+
+def current_claims() -> dict[str, Any]:
+    """Claims of the token of the current request (see `claims_required`)."""
+    return get_jwt()
+
+
+def claims_required(role: str | None = None) -> Callable:
+    """Like `jwt_required()`, but also checks the role/tariff claims are still current.
+
+    :param str | None role: Role required to access the endpoint, defaults to None
+    """
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            identity = get_jwt_identity()
+            claims = get_jwt()
+            version = _current_version(identity)
+            if version != claims.get("cv") and version != _DELETED:
+                # The change may come from another worker, check the database once.
+                version = _current_version(identity, reload=True)
+            if version == _DELETED:
+                return abort(404, "User not found.")
+            if claims.get("cv") != version:
+                return abort(401, "Token claims are outdated, refresh the token.")
+            if role is not None and claims.get("role") != role:
+                return abort(403, f"{role.capitalize()} role required.")
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
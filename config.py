@@ -15,16 +15,78 @@ class Settings:
 
     host: str = getenv("HOST", "127.0.0.1")
     port: int = int(getenv("PORT", "5000"))
+    workers: int = int(getenv("WORKERS", "0"))
+    threads: int = int(getenv("THREADS", "4"))
+    worker_timeout: int = int(getenv("WORKER_TIMEOUT", "60"))
+    graceful_timeout: int = int(getenv("GRACEFUL_TIMEOUT", "30"))
+    keepalive: int = int(getenv("KEEPALIVE", "5"))
+    max_requests: int = int(getenv("MAX_REQUESTS", "0"))
+    memory_limit_mib: int = int(getenv("MEMORY_LIMIT_MIB", "0"))
+    worker_memory_mib: int = int(getenv("WORKER_MEMORY_MIB", "150"))
+    hash_process_memory_mib: int = int(getenv("HASH_PROCESS_MEMORY_MIB", "30"))
     secret_key: str = getenv("SECRET_KEY", token_hex(32))
     jwt_secret_key: str = getenv("JWT_SECRET_KEY", token_hex(32))
     jwt_issuer: str = getenv("JWT_ISSUER", "")
+    claims_ttl: float = float(getenv("CLAIMS_TTL", "30"))
+    claims_cache_size: int = int(getenv("CLAIMS_CACHE_SIZE", "100000"))
+    encryption_key: str = getenv("KEY", "")
+    previous_keys: str = getenv("PREVIOUS_KEYS", "")
+    blind_index_key: str = getenv("BLIND_INDEX_KEY", "")
+    blind_index_prefixes: bool = getenv("BLIND_INDEX_PREFIXES", "false").lower() in {"1", "true", "yes"}
+    blind_index_min_prefix: int = int(getenv("BLIND_INDEX_MIN_PREFIX", "3"))
 
     db_host: str = getenv("DB_HOST", "127.0.0.1")
     db_port: int = int(getenv("DB_PORT", "3306"))
     db_name: str = getenv("DB_NAME", "lesjeunot")
     db_user: str = getenv("DB_USER", "root")
     db_password: str = getenv("DB_PASSWORD", "")
+    db_pool_size: int = int(getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(getenv("DB_MAX_OVERFLOW", "10"))
+    db_pool_timeout: float = float(getenv("DB_POOL_TIMEOUT", "30"))
+    db_pool_recycle: int = int(getenv("DB_POOL_RECYCLE", "1800"))
+    db_pre_ping: str = getenv("DB_PRE_PING", "checkout")
+    db_liveness_interval: float = float(getenv("DB_LIVENESS_INTERVAL", "30"))
+    db_replica_urls: str = getenv("DB_REPLICA_URLS", "")
+    db_sticky_seconds: float = float(getenv("DB_STICKY_SECONDS", "5"))
+    db_auto_migrate: bool = getenv("DB_AUTO_MIGRATE", "true").lower() in {"1", "true", "yes"}
+    db_query_accounting: str = getenv("DB_QUERY_ACCOUNTING", "off")
+    db_query_budget: int = int(getenv("DB_QUERY_BUDGET", "20"))
+    db_slow_query_ms: float = float(getenv("DB_SLOW_QUERY_MS", "200"))
+    compact_storage: bool = getenv("COMPACT_STORAGE", "false").lower() in {"1", "true", "yes"}
+    redis_url: str = getenv("REDIS_URL", "")
+    profile_cache_ttl: float = float(getenv("PROFILE_CACHE_TTL", "60"))
+    profile_cache_size: int = int(getenv("PROFILE_CACHE_SIZE", "10000"))
+    profile_cache_mib: int = int(getenv("PROFILE_CACHE_MIB", "16"))
+    trusted_proxies: int = int(getenv("TRUSTED_PROXIES", "0"))
+    login_ip_per_minute: float = float(getenv("LOGIN_IP_PER_MINUTE", "30"))
+    login_ip_burst: int = int(getenv("LOGIN_IP_BURST", "10"))
+    login_account_per_minute: float = float(getenv("LOGIN_ACCOUNT_PER_MINUTE", "6"))
+    login_account_burst: int = int(getenv("LOGIN_ACCOUNT_BURST", "5"))
+    login_backoff_base: float = float(getenv("LOGIN_BACKOFF_BASE", "1"))
+    login_backoff_max: float = float(getenv("LOGIN_BACKOFF_MAX", "300"))
+    login_failure_window: float = float(getenv("LOGIN_FAILURE_WINDOW", "900"))
+    http_validators: str = getenv("HTTP_VALIDATORS", "auto")
+    compress_min_bytes: int = int(getenv("COMPRESS_MIN_BYTES", "1024"))
+    compress_level: int = int(getenv("COMPRESS_LEVEL", "5"))
+    metrics: bool = getenv("METRICS", "true").lower() in {"1", "true", "yes"}
+    metrics_dir: str = getenv("METRICS_DIR", "")
+    metrics_flush_interval: float = float(getenv("METRICS_FLUSH_INTERVAL", "5"))
     cors_origins: str = getenv("CORS_ORIGINS", "*")
+    internal_token: str = getenv("INTERNAL_TOKEN", "")
+    tariffs_source: str = getenv("TARIFFS_SOURCE", "builtin")
+    tariffs_file: str = getenv("TARIFFS_FILE", "tariffs.json")
+    tariffs_reload_interval: float = float(getenv("TARIFFS_RELOAD_INTERVAL", "30"))
+    ticket_batch_max: int = int(getenv("TICKET_BATCH_MAX", "100"))
+
+    hash_memory_budget_mib: int = int(getenv("HASH_MEMORY_BUDGET_MIB", "4096"))
+    hash_workers: int = int(getenv("HASH_WORKERS", "0"))
+    hash_queue_size: int = int(getenv("HASH_QUEUE_SIZE", "16"))
+    hash_queue_timeout: float = float(getenv("HASH_QUEUE_TIMEOUT", "5"))
+    hash_profile: str = getenv("HASH_PROFILE", "")
+    hash_profile_path: str = getenv("HASH_PROFILE_PATH", "hasher_profiles.json")
+    rehash_mode: str = getenv("REHASH_MODE", "opportunistic")
+    rehash_queue_size: int = int(getenv("REHASH_QUEUE_SIZE", "64"))
+    rehash_attempts: int = int(getenv("REHASH_ATTEMPTS", "3"))
 
     @property
     def database_url(self) -> str:
@@ -35,5 +97,15 @@ class Settings:
             f"@{self.db_host}:{self.db_port}/{self.db_name}"
         )
 
+    @property
+    def previous_encryption_keys(self) -> list[str]:
+        """Older Fernet keys still accepted for decryption (comma-separated PREVIOUS_KEYS)."""
+        return [key.strip() for key in self.previous_keys.split(",") if key.strip()]
+
+    @property
+    def replica_urls(self) -> list[str]:
+        """SQLAlchemy URLs of the read replicas (comma-separated DB_REPLICA_URLS)."""
+        return [url.strip() for url in self.db_replica_urls.split(",") if url.strip()]
+
 
 settings = Settings()
@@ -1,27 +1,403 @@
+import logging
+from collections import Counter
+from collections.abc import Callable
 from contextlib import contextmanager
+from os import getpid
+from random import choice
+from threading import Lock, Thread
+from time import perf_counter, sleep, time
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
+from flask import g, has_request_context, request
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 
 from config import settings
+from modules import Metrics
+from modules.Cache import Flags, TTLCache
 
 
-engine = create_engine(
-    settings.database_url,
-    echo=False,
-    pool_pre_ping=True,
-    pool_recycle=1800,
-)
+logger = logging.getLogger(__name__)
+
+
+def _choice(variable: str, value: str, allowed: tuple[str, ...]) -> str:
+    """Refuse to start on a typo, rather than silently falling back to the default behavior."""
+    if value not in allowed:
+        raise RuntimeError(
+            f"Environment variable {variable} must be one of: {', '.join(allowed)} (got {value!r})."
+        )
+    return value
+
+
+_choice("DB_PRE_PING", settings.db_pre_ping, ("checkout", "background", "off"))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._stats_lock = Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = perf_counter() - start
+            Metrics.add("db", waited)
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def _create_engine(url: str) -> Engine:
+    return create_engine(
+        url,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=settings.db_pre_ping == "checkout",
+        pool_recycle=settings.db_pool_recycle,
+    )
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A request ran more statements than its budget, or lazy loaded a relationship (DB_QUERY_ACCOUNTING=raise)."""
+
+
+# off: nothing counted; report: requests over budget are logged; raise: they fail.
+QUERY_ACCOUNTING = _choice("DB_QUERY_ACCOUNTING", settings.db_query_accounting, ("off", "report", "raise"))
+_accounting_lock = Lock()
+_accounting = {"requests": 0, "over_budget": 0, "lazy_loads": 0, "slow_queries": 0}
+
+
+def _request_queries() -> dict | None:
+    if not has_request_context():
+        return None
+    queries = g.get("_queries")
+    if queries is None:
+        queries = g._queries = {"statements": 0, "rows": 0, "lazy_loads": Counter(), "violations": []}
+    return queries
+
+
+def _violation(queries: dict, message: str) -> None:
+    if QUERY_ACCOUNTING == "raise":
+        raise QueryBudgetExceeded(message)
+    queries["violations"].append(message)
+
+
+def _shape(parameters, executemany: bool) -> str:
+    """Types of the bound parameters, never their values."""
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} x {_shape(rows[0], False)}" if rows else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _count_statement() -> None:
+    queries = _request_queries()
+    if queries is None:
+        return
+    queries["statements"] += 1
+    budget = g.get("query_budget") or settings.db_query_budget
+    if budget and queries["statements"] == budget + 1:
+        _violation(queries, f"more than {budget} statements")
+
+
+def _account(cursor, statement: str, parameters, executemany: bool, elapsed: float) -> None:
+    queries = _request_queries()
+    if queries is not None and cursor.rowcount > 0:
+        queries["rows"] += cursor.rowcount
+    if elapsed * 1000 >= settings.db_slow_query_ms:
+        with _accounting_lock:
+            _accounting["slow_queries"] += 1
+        logger.warning(
+            "Slow query (%.1f ms) %s params=%s",
+            elapsed * 1000,
+            " ".join(statement.split())[:500],
+            _shape(parameters, executemany),
+        )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info["executing"] = perf_counter()
+    if QUERY_ACCOUNTING != "off":
+        _count_statement()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.pop("executing", None)
+    if started is None:
+        return
+    elapsed = perf_counter() - started
+    Metrics.add("db", elapsed)
+    if QUERY_ACCOUNTING != "off":
+        _account(cursor, statement, parameters, executemany, elapsed)
+
+
+def _lazy_loaded(orm_execute_state) -> None:
+    # Every listing selects the columns it needs, a lazy load is an N+1 in the making.
+    # Writes have no load options, reading them raises.
+    if not orm_execute_state.is_select or not orm_execute_state.is_relationship_load:
+        return
+    state = orm_execute_state.lazy_loaded_from
+    queries = _request_queries() if state is not None else None
+    if queries is None:
+        return
+    path = orm_execute_state.loader_strategy_path
+    prop = path.path[-1] if path is not None and path.path else None
+    name = f"{state.class_.__name__}.{getattr(prop, 'key', '?')}"
+    with _accounting_lock:
+        _accounting["lazy_loads"] += 1
+    if not queries["lazy_loads"]:
+        _violation(queries, f"lazy load of {name}")
+    queries["lazy_loads"][name] += 1
+
+
+if QUERY_ACCOUNTING != "off":
+    event.listen(Session, "do_orm_execute", _lazy_loaded)
+
+
+engine = _create_engine(settings.database_url)
+replica_engines = [_create_engine(url) for url in settings.replica_urls]
 SessionLocal = scoped_session(
     sessionmaker(bind=engine, autocommit=False, autoflush=False)
 )
+ReadSession = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+# Users who wrote recently read from the primary, so they see their own writes
+# despite replication lag. The next request may reach another worker: the client
+# carries the deadline in a cookie and, with REDIS_URL, every worker shares it.
+STICKY_COOKIE = "primary_until"
+_sticky = TTLCache(ttl=settings.db_sticky_seconds, maxsize=100000)
+_shared_sticky = (
+    Flags(settings.redis_url, "sticky:", settings.db_sticky_seconds)
+    if settings.redis_url and settings.replica_urls
+    else None
+)
+
+
+# Called with the names of the tables written and the current user, after each commit.
+_write_listeners: list[Callable[[set[str], str | None], None]] = []
+
+
+@event.listens_for(SessionLocal.session_factory, "after_flush")
+def _flushed(session, flush_context) -> None:
+    session.info["wrote"] = True
+    tables = session.info.setdefault("tables", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tables.add(obj.__table__.name)
+
+
+@event.listens_for(SessionLocal.session_factory, "do_orm_execute")
+def _executed(orm_execute_state) -> None:
+    if not orm_execute_state.is_select:
+        session = orm_execute_state.session
+        session.info["wrote"] = True
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            session.info.setdefault("tables", set()).add(table.name)
+
+
+@event.listens_for(SessionLocal.session_factory, "after_commit")
+def _committed(session) -> None:
+    tables = session.info.pop("tables", None)
+    if tables:
+        identity = _request_identity()
+        for listener in _write_listeners:
+            listener(tables, identity)
+    for callback in session.info.pop("on_commit", ()):
+        callback()
+
+
+@event.listens_for(SessionLocal.session_factory, "after_rollback")
+def _rolled_back(session) -> None:
+    session.info.pop("tables", None)
+    session.info.pop("on_commit", None)
+
+
+def on_write(listener: Callable[[set[str], str | None], None]) -> None:
+    """Register `listener(tables, identity)`, called after every commit that wrote to `tables`."""
+    _write_listeners.append(listener)
+
+
+def on_commit(session, callback) -> None:
+    """Run `callback` once the session's current work is committed (never if it is rolled back).
+
+    :param Session session: The session doing the work
+    :param Callable callback: Called without arguments
+    """
+    session.info.setdefault("on_commit", []).append(callback)
+
+
+def _request_identity() -> str | None:
+    if not has_request_context():
+        return None
+    from flask_jwt_extended import get_jwt_identity
+
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+_liveness_lock = Lock()
+_liveness_pid: int | None = None
+_liveness = {"checks": 0, "failures": 0, "last_error": None}
+
+
+def _check_liveness() -> None:
+    while True:
+        sleep(settings.db_liveness_interval)
+        for target in (engine, *replica_engines):
+            error = None
+            try:
+                with target.connect() as connection:
+                    connection.exec_driver_sql("SELECT 1")
+            except Exception as exception:
+                # A disconnect invalidates the whole pool, stale connections
+                # are then replaced on their next checkout. Anything else (e.g. a
+                # checkout timeout) must not stop the thread either.
+                error = f"{target.url.host}: {exception}"
+            with _liveness_lock:
+                _liveness["checks"] += 1
+                if error is not None:
+                    _liveness["failures"] += 1
+                    _liveness["last_error"] = error
+
+
+def start_liveness_checker() -> None:
+    """Ping the database and its replicas in the background instead of on every checkout (DB_PRE_PING=background)."""
+    global _liveness_pid
+    if settings.db_pre_ping != "background" or _liveness_pid == getpid():
+        return
+    with _liveness_lock:
+        if _liveness_pid == getpid():
+            return
+        _liveness_pid = getpid()
+        Thread(target=_check_liveness, name="db-liveness", daemon=True).start()
+
+
+def pool_stats() -> dict:
+    """Connection pool usage of this process."""
+    pool = engine.pool
+    with _liveness_lock:
+        liveness = dict(_liveness)
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": settings.db_max_overflow,
+        "pre_ping": settings.db_pre_ping,
+        "liveness": liveness,
+    }
+    if replica_engines:
+        stats["replicas"] = [
+            {
+                "size": replica.pool.size(),
+                "checked_out": replica.pool.checkedout(),
+                "idle": replica.pool.checkedin(),
+                "overflow": max(0, replica.pool.overflow()),
+            }
+            for replica in replica_engines
+        ]
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                checkout_timeouts=pool.checkout_timeouts,
+                wait_seconds_total=round(pool.wait_total, 6),
+                wait_seconds_max=round(pool.wait_max, 6),
+                wait_seconds_avg=round(pool.wait_total / pool.checkouts, 6)
+                if pool.checkouts
+                else 0.0,
+            )
+    return stats
+
+
+def _wrote(session) -> bool:
+    return bool(
+        session.info.get("wrote") or session.new or session.dirty or session.deleted
+    )
+
+
+def _sticky_cookie() -> bool:
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+    now = time()
+    # A forged deadline may not pin a client to the primary for longer.
+    return now < until <= now + settings.db_sticky_seconds
+
+
+def _use_replica() -> bool:
+    if not replica_engines:
+        return False
+    if _sticky_cookie():
+        return False
+    identity = _request_identity()
+    if identity is None:
+        return True
+    if _sticky.get(identity):
+        return False
+    return _shared_sticky is None or not _shared_sticky.get(identity)
+
+
+def _stick(response) -> None:
+    """Send the requests following a write to the primary, whichever worker serves them."""
+    response.set_cookie(
+        STICKY_COOKIE,
+        f"{time() + settings.db_sticky_seconds:.3f}",
+        max_age=max(1, int(settings.db_sticky_seconds)),
+        httponly=True,
+        samesite="Lax",
+    )
+    identity = _request_identity()
+    if identity is not None:
+        _sticky.set(identity, True)
+        if _shared_sticky is not None:
+            _shared_sticky.set(identity)
+
+
+def release_connections() -> None:
+    """Return the request's connections to the pool before slow work (e.g. hashing).
+
+    Only sessions that did not write yet are released, they check a connection
+    out again on their next statement.
+    """
+    if not has_request_context():
+        return
+    for name in ("_db_session", "_db_read_session"):
+        session = g.get(name)
+        if session is not None and not _wrote(session):
+            session.rollback()
+
 
 @contextmanager
-def get_session():
-    """Provide a transactional scope for SQLAlchemy operations."""
-    session = SessionLocal()
+def _transaction(session):
+    """Standalone scope (outside of requests): commit on success, always close."""
     try:
         yield session
         session.commit()
@@ -30,3 +406,142 @@ def get_session():
         raise
     finally:
         session.close()
+
+
+@contextmanager
+def _unit_of_work(session):
+    """Scope inside a request: flush only, the request commits once at the end."""
+    try:
+        yield session
+        session.flush()
+    except Exception:
+        session.rollback()
+        session.info.pop("wrote", None)
+        raise
+
+
+def _request_session():
+    session = g.get("_db_session")
+    if session is None:
+        start_liveness_checker()
+        session = g._db_session = SessionLocal()
+        session.info.pop("wrote", None)
+    return session
+
+
+def _request_read_session():
+    if not _use_replica():
+        return _request_session()
+    session = g.get("_db_read_session")
+    if session is None:
+        session = g._db_read_session = ReadSession(bind=choice(replica_engines))
+    return session
+
+
+def served_by_replica() -> bool:
+    """Whether the current request read from a replica (possibly behind the primary)."""
+    return has_request_context() and g.get("_db_read_session") is not None
+
+
+@contextmanager
+def get_read_session():
+    """Provide a read-only scope, on a replica when one is configured.
+
+    Falls back to the primary when there is no replica, or when the current
+    user wrote less than DB_STICKY_SECONDS ago (read-your-writes).
+    """
+    if has_request_context():
+        with _unit_of_work(_request_read_session()) as session:
+            yield session
+        return
+    if not replica_engines:
+        with _transaction(SessionLocal()) as session:
+            yield session
+        return
+    session = ReadSession(bind=choice(replica_engines))
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+@contextmanager
+def get_session():
+    """Provide a transactional scope for SQLAlchemy operations.
+
+    Inside a request, every scope shares the request's session (one identity map,
+    connections checked out lazily) and the work is committed once by `init_app`.
+    Handlers declared read-only (see `RESTful_Builder.read_only`) get a read session instead.
+    """
+    if not has_request_context():
+        start_liveness_checker()
+        with _transaction(SessionLocal()) as session:
+            yield session
+        return
+    session = _request_read_session() if g.get("read_only") else _request_session()
+    with _unit_of_work(session) as session:
+        yield session
+
+
+def _end_request(response):
+    session = g.get("_db_session")
+    if session is None or not _wrote(session):
+        return response
+    if response.status_code >= 500:
+        session.rollback()
+        return response
+    session.flush()  # statements are already timed, only the COMMIT is left
+    with Metrics.timed("db"):
+        session.commit()
+    if replica_engines:
+        _stick(response)
+    return response
+
+
+def _remove_sessions(exception: BaseException | None = None) -> None:
+    read_session = g.pop("_db_read_session", None)
+    if read_session is not None:
+        read_session.close()
+    g.pop("_db_session", None)
+    SessionLocal.remove()
+
+
+def _report_queries(exception: BaseException | None = None) -> None:
+    queries = g.pop("_queries", None)
+    with _accounting_lock:
+        _accounting["requests"] += 1
+        if queries is not None and queries["violations"]:
+            _accounting["over_budget"] += 1
+    if queries is None or not queries["violations"]:
+        return
+    rule = request.url_rule.rule if request.url_rule else request.path
+    lazy = ", ".join(f"{name} x{count}" for name, count in queries["lazy_loads"].items())
+    logger.warning(
+        "%s %s: %s (%d statements, %d rows%s)",
+        request.method,
+        rule,
+        "; ".join(queries["violations"]),
+        queries["statements"],
+        queries["rows"],
+        f", lazy loads: {lazy}" if lazy else "",
+    )
+
+
+def query_stats() -> dict:
+    """Query accounting counters of this process (DB_QUERY_ACCOUNTING)."""
+    with _accounting_lock:
+        return {
+            **_accounting,
+            "mode": QUERY_ACCOUNTING,
+            "budget": settings.db_query_budget,
+            "slow_query_ms": settings.db_slow_query_ms,
+        }
+
+
+def init_app(app) -> None:
+    """Commit each request's unit of work once, and always release its sessions."""
+    app.after_request(_end_request)
+    if QUERY_ACCOUNTING != "off":
+        app.teardown_request(_report_queries)
+    app.teardown_appcontext(_remove_sessions)
@@ -0,0 +1,124 @@
+from collections.abc import Callable
+from email.utils import formatdate
+from functools import wraps
+from hashlib import sha256
+from math import ceil
+from time import time
+
+from flask import Response, request
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from config import settings
+from database import on_write, served_by_replica
+from modules.Cache import redis
+from modules.Versions import LocalVersions, RedisVersions
+
+
+# Per-process counters would disagree between workers, validators are only
+# handed out when the counters are shared (REDIS_URL) or there is one process
+# (`main.py`, or `serve.py` starting a single worker: both set WORKERS to 1).
+if settings.http_validators == "off":
+    VERSIONS = None
+elif settings.redis_url:
+    VERSIONS = RedisVersions(settings.redis_url)
+elif settings.http_validators == "on" or settings.workers == 1:
+    VERSIONS = LocalVersions()
+else:
+    VERSIONS = None
+
+_STORE_ERRORS = (redis.RedisError,) if redis is not None else ()
+
+# Writes to a table also change the rows deleted with it (ON DELETE CASCADE).
+_CASCADES = {"users": ("tickets", "user_search_tokens")}
+
+
+def user_key() -> list[str]:
+    """Resources of the current user (profile, tickets)."""
+    return [f"user:{get_jwt_identity()}"]
+
+
+def table_key(*tables: str) -> Callable[[], list[str]]:
+    """Resources spanning whole tables (admin listings)."""
+    return lambda: [f"table:{table}" for table in tables]
+
+
+def _bump(tables: set[str], identity: str | None) -> None:
+    keys = {f"table:{table}" for table in tables}
+    for table in tables:
+        keys.update(f"table:{cascaded}" for cascaded in _CASCADES.get(table, ()))
+    if identity is not None:
+        keys.add(f"user:{identity}")
+    try:
+        VERSIONS.bump(keys)
+    except _STORE_ERRORS:
+        pass  # validators made meanwhile stay valid until the next write
+
+
+if VERSIONS is not None:
+    on_write(_bump)
+
+
+def conditional(keys: Callable[[], list[str]]) -> Callable:
+    """ETag/Last-Modified for a read endpoint, 304 before the view runs when they match.
+
+    Must be applied under the authentication decorator. The validators depend on
+    the version counters of `keys()` (bumped by every committed write), the URL
+    and the token claims.
+
+    :param Callable keys: Returns the version keys the response depends on
+    """
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if VERSIONS is None:
+                return fn(*args, **kwargs)
+            try:
+                # Read before the view: a write racing with it can only make
+                # the next validators differ, never tag newer data as older.
+                epoch, versions = VERSIONS.get(keys())
+            except _STORE_ERRORS:
+                return fn(*args, **kwargs)
+            claims = get_jwt()
+            etag = sha256(
+                "|".join(
+                    [
+                        epoch,
+                        request.full_path,
+                        str(claims.get("sub")),
+                        str(claims.get("cv")),
+                        *(str(count) for count, _ in versions),
+                    ]
+                ).encode("utf-8")
+            ).hexdigest()[:32]
+            # Omitted until every key was written once, and within a second of
+            # the last write (HTTP dates have a one second resolution).
+            modified = max(at for _, at in versions) if versions else 0.0
+            last_modified = (
+                ceil(modified)
+                if all(at for _, at in versions) and time() - modified >= 1
+                else None
+            )
+
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                fresh = (
+                    last_modified is not None
+                    and since is not None
+                    and last_modified <= since.timestamp()
+                )
+            if fresh:
+                response = Response(status=304)
+            else:
+                response = fn(*args, **kwargs)
+                # A lagging replica may have served data older than `versions`.
+                if response.status_code != 200 or served_by_replica():
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
@@ -1,18 +1,39 @@
 from datetime import timedelta
 
-from flask import Flask, Response
+from flask import Flask, Response, request
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from config import settings
-from database import Base, engine
-from models import Ticket, User  # ensure models register with metadata
+from database import Base, engine, init_app
+from migrations import upgrade
+from models import TariffRecord, Ticket, User  # ensure models register with metadata
+from modules import Metrics
+from modules.Hasher import HasherBusy
+from modules.Responses import FastJSONProvider, abort, compress
 
 
 def create_app() -> Flask:
     """Application factory with sane defaults and registrations."""
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    if settings.metrics:
+        # Registered first: the total covers every other hook.
+        histograms = app.extensions["metrics"] = Metrics.Histograms(
+            settings.metrics_dir, settings.metrics_flush_interval
+        )
+        app.before_request(Metrics.start)
+
+        @app.teardown_request
+        def record_metrics(error: BaseException | None = None):
+            rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+            histograms.record(rule, request.method)
+
+    if settings.trusted_proxies:
+        # Client IPs (login throttling, internal routes) come from X-Forwarded-For.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=settings.trusted_proxies)
     app.config.update(
         SECRET_KEY=settings.secret_key,
         JWT_SECRET_KEY=settings.jwt_secret_key,
@@ -29,41 +50,63 @@ def create_app() -> Flask:
     CORS(app, resources={r"/*": {"origins": origins or "*"}})
 
     Base.metadata.create_all(bind=engine)
+    if settings.db_auto_migrate:
+        upgrade(engine)
+    init_app(app)
+
+    from routes.v1.Tariffs import reload as reload_tariffs, start_watcher
+
+    reload_tariffs()
 
     from routes.Index import bp as index
+    from routes.Internal import bp as internal
+    from routes.v1.Tariffs import bp as v1_tariffs
     from routes.v1.Tickets import bp as v1_tickets
     from routes.v1.Users import bp as v1_users
 
     app.register_blueprint(index, url_prefix="/")
+    app.register_blueprint(internal, url_prefix="/internal")
     app.register_blueprint(v1_users, url_prefix="/v1/user")
     app.register_blueprint(v1_tickets, url_prefix="/v1/ticket")
+    app.register_blueprint(v1_tariffs, url_prefix="/v1/tariff")
+    app.before_request(start_watcher)
+
+    from routes.v1.Users import refresh_compact_pending, start_compact_watcher
+
+    if not settings.compact_storage:
+        refresh_compact_pending()
+        app.before_request(start_compact_watcher)
 
     @app.errorhandler(401)
     def error_handler_401(error: HTTPException):
-        return {
-            "status": error.code,
-            "error": error.name,
-            "message": "Authorization token required.",
-        }, 401
+        return abort(401, "Authorization token required.")
 
     @app.errorhandler(404)
     def error_handler_404(error: HTTPException):
-        return {
-            "status": error.code,
-            "error": error.name,
-            "message": "The requested URL was not found.",
-        }, 404
-
-    @app.after_request
-    def after_request(response: Response):
-        response.headers.update({"Content-Type": "application/json"})
-        return response
+        return abort(404, "The requested URL was not found.")
 
-    return app
+    if settings.compress_min_bytes > 0:
+        @app.after_request
+        def compress_response(response: Response):
+            return compress(
+                response,
+                request.accept_encodings,
+                min_bytes=settings.compress_min_bytes,
+                level=settings.compress_level,
+            )
 
+    @app.errorhandler(HasherBusy)
+    def error_handler_hasher_busy(error: HasherBusy):
+        return abort(
+            503,
+            "Server is busy, retry later.",
+            headers={"Retry-After": str(error.retry_after)},
+        )
 
-app = create_app()
+    return app
 
 
+# No application at import: Argon2 worker processes re-import the entry script.
 if __name__ == "__main__":
-    app.run(host=settings.host, port=settings.port, debug=False)
+    settings.workers = 1  # the development server is a single process
+    create_app().run(host=settings.host, port=settings.port, debug=False)
@@ -0,0 +1,500 @@
+from argparse import ArgumentParser
+from collections.abc import Callable
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    delete,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection, Engine
+
+
+# Fresh databases get the current schema from `Base.metadata.create_all`, so
+# every migration must detect when there is nothing to do.
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = []
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("name", String(64), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def migration(name: str) -> Callable:
+    """Register a migration, they are applied in registration order."""
+    def decorator(fn: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        MIGRATIONS.append((name, fn))
+        return fn
+    return decorator
+
+
+def _foreign_key(connection: Connection, table: str, column: str) -> dict | None:
+    for fk in inspect(connection).get_foreign_keys(table):
+        if fk["constrained_columns"] == [column]:
+            return fk
+    return None
+
+
+@migration("0001_tickets_user_on_delete_cascade")
+def _tickets_user_on_delete_cascade(connection: Connection) -> None:
+    fk = _foreign_key(connection, "tickets", "user_id")
+    if fk is not None:
+        if (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+            return
+        connection.exec_driver_sql(f"ALTER TABLE tickets DROP FOREIGN KEY `{fk['name']}`")
+    connection.exec_driver_sql(
+        "ALTER TABLE tickets ADD CONSTRAINT fk_tickets_user_id "
+        "FOREIGN KEY (user_id) REFERENCES users (uuid) ON DELETE CASCADE"
+    )
+
+
+@migration("0002_tickets_showing_columns")
+def _tickets_showing_columns(connection: Connection) -> None:
+    from modules.Showings import MAX_LENGTH
+
+    existing = {c["name"] for c in inspect(connection).get_columns("tickets")}
+    if "showing_id" not in existing:
+        connection.exec_driver_sql(
+            f"ALTER TABLE tickets ADD COLUMN showing_id VARCHAR({MAX_LENGTH}) NULL, "
+            "ADD COLUMN showing_start DATETIME NULL, "
+            f"ADD COLUMN showing_room VARCHAR({MAX_LENGTH}) NULL, "
+            "MODIFY COLUMN showing TEXT NULL"
+        )
+    indexes = {i["name"] for i in inspect(connection).get_indexes("tickets")}
+    for name, columns in (
+        ("ix_tickets_user_id_showing_start", "user_id, showing_start"),
+        ("ix_tickets_showing_id_showing_start", "showing_id, showing_start"),
+    ):
+        if name not in indexes:
+            connection.exec_driver_sql(f"CREATE INDEX {name} ON tickets ({columns})")
+
+
+def showings_backfill(engine: Engine, chunk_size: int = 1000) -> int:
+    """Fill the showing columns of tickets written before migration 0002, by chunks, service running.
+
+    :param Engine engine: The engine of the database
+    :param int chunk_size: Rows per transaction, defaults to 1000
+    :return int: The number of tickets converted
+    """
+    from modules.Showings import split_legacy
+
+    # Rows written before the migration only have the JSON `showing`; the
+    # application may already be writing rows with the new columns.
+    legacy = text(
+        "SELECT uuid, showing FROM tickets WHERE (:cursor IS NULL OR uuid > :cursor) "
+        "AND showing_id IS NULL AND showing_start IS NULL AND showing_room IS NULL "
+        "AND showing IS NOT NULL ORDER BY uuid LIMIT :limit"
+    )
+    update = text(
+        "UPDATE tickets SET showing_id = :showing_id, showing_start = :showing_start, "
+        "showing_room = :showing_room, showing = :showing WHERE uuid = :uuid"
+    )
+    cursor = None
+    converted = 0
+    with engine.connect() as connection:
+        while True:
+            rows = connection.execute(legacy, {"cursor": cursor, "limit": chunk_size}).all()
+            if not rows:
+                break
+            connection.execute(
+                update, [{"uuid": uuid, **split_legacy(showing)} for uuid, showing in rows]
+            )
+            connection.commit()
+            converted += len(rows)
+            cursor = rows[-1].uuid
+    return converted
+
+
+_BLIND_INDEXED = ("lastname", "firstname", "email")
+
+
+@migration("0003_users_blind_indexes")
+def _users_blind_indexes(connection: Connection) -> None:
+    existing = {c["name"] for c in inspect(connection).get_columns("users")}
+    added = [
+        f"ADD COLUMN {field}_bidx VARCHAR(32) NULL"
+        for field in _BLIND_INDEXED
+        if f"{field}_bidx" not in existing
+    ]
+    if added:
+        connection.exec_driver_sql(f"ALTER TABLE users {', '.join(added)}")
+    indexes = {i["name"] for i in inspect(connection).get_indexes("users")}
+    for field in _BLIND_INDEXED:
+        if f"ix_users_{field}_bidx" not in indexes:
+            connection.exec_driver_sql(
+                f"CREATE INDEX ix_users_{field}_bidx ON users ({field}_bidx)"
+            )
+
+
+@migration("0004_users_claims_version")
+def _users_claims_version(connection: Connection) -> None:
+    existing = {c["name"] for c in inspect(connection).get_columns("users")}
+    if "claims_version" not in existing:
+        connection.exec_driver_sql(
+            "ALTER TABLE users ADD COLUMN claims_version INTEGER NOT NULL DEFAULT 0"
+        )
+
+
+def blind_index_backfill(engine: Engine, chunk_size: int = 1000) -> int:
+    """(Re)compute the blind indexes of every user, after setting or changing BLIND_INDEX_KEY.
+
+    :return int: Number of users indexed
+    """
+    from config import settings
+    from models import SearchToken, User
+    from modules.Crypto import BlindIndex, Cipher
+
+    if not settings.blind_index_key:
+        raise RuntimeError("Environment variable BLIND_INDEX_KEY must be set.")
+    cipher = Cipher(settings.encryption_key, settings.previous_encryption_keys)
+    index = BlindIndex(settings.blind_index_key, min_prefix=settings.blind_index_min_prefix)
+    users, tokens = User.__table__, SearchToken.__table__
+    set_indexes = (
+        update(users)
+        .where(users.c.uuid == bindparam("key"))
+        .values({f"{field}_bidx": bindparam(f"new_{field}") for field in _BLIND_INDEXED})
+    )
+
+    indexed = 0
+    cursor = None
+    while True:
+        with engine.begin() as connection:
+            stmt = select(users.c.uuid, *(users.c[f] for f in _BLIND_INDEXED))
+            if cursor is not None:
+                stmt = stmt.where(users.c.uuid > cursor)
+            rows = connection.execute(stmt.order_by(users.c.uuid).limit(chunk_size)).all()
+            if not rows:
+                break
+            updates, inserts = [], []
+            for key, *encrypted in rows:
+                plain = dict(zip(_BLIND_INDEXED, cipher.decrypt_many(encrypted)))
+                updates.append(
+                    {
+                        "key": key,
+                        **{
+                            f"new_{field}": None if value is None else index.digest(field, value)
+                            for field, value in plain.items()
+                        },
+                    }
+                )
+                if settings.blind_index_prefixes:
+                    inserts.extend(
+                        {"user_id": key, "field": field, "token": token}
+                        for field, value in plain.items()
+                        if value is not None
+                        for token in index.tokens(field, value)
+                    )
+            connection.execute(set_indexes, updates)
+            connection.execute(delete(tokens).where(tokens.c.user_id.in_([row.uuid for row in rows])))
+            if inserts:
+                connection.execute(insert(tokens), inserts)
+        indexed += len(rows)
+        cursor = rows[-1].uuid
+    return indexed
+
+
+# Online conversion to COMPACT_STORAGE (raw binary Fernet tokens, BINARY(16) uuids):
+#   1. compact prepare   adds shadow columns and triggers keeping them in sync,
+#   2. compact backfill  fills the shadow columns in key-ordered chunks (app running),
+#   3. compact cutover   swaps the columns; stop the app, run it, restart with COMPACT_STORAGE=true.
+_B64 = "FROM_BASE64(REPLACE(REPLACE({0}, '-', '+'), '_', '/'))"
+# A token too long for its column is left NULL instead of failing the write
+# (strict mode), `compact cutover` refuses to run until none is left.
+_B64_FITTING = f"IF(LENGTH({_B64}) <= {{size}}, {_B64}, NULL)"
+_COMPACT = {
+    "users": {
+        "uuid": ("BINARY(16)", "UNHEX({0})"),
+        "lastname": ("VARBINARY({size})", _B64_FITTING),
+        "firstname": ("VARBINARY({size})", _B64_FITTING),
+        "age": ("VARBINARY({size})", _B64_FITTING),
+        "email": ("VARBINARY({size})", _B64_FITTING),
+    },
+    "tickets": {
+        "uuid": ("BINARY(16)", "UNHEX({0})"),
+        "user_id": ("BINARY(16)", "UNHEX({0})"),
+    },
+}
+_PII = ("lastname", "firstname", "age", "email")
+
+
+def _compact_columns(table: str):
+    from models import PII_TOKEN_BYTES
+
+    size = str(PII_TOKEN_BYTES)
+    for column, (sql_type, expr) in _COMPACT[table].items():
+        yield column, sql_type.replace("{size}", size), expr.replace("{size}", size)
+
+
+def _count_per_column(connection: Connection, table: str, condition: str, columns) -> dict[str, int]:
+    """Rows of `table` matching `condition` (formatted with each column), in one scan."""
+    counts = connection.execute(
+        text(
+            f"SELECT {', '.join(f'COALESCE(SUM({condition.format(c)}), 0)' for c in columns)} "
+            f"FROM {table}"
+        )
+    ).one()
+    return {f"{table}.{column}": int(count) for column, count in zip(columns, counts) if count}
+
+
+def compact_oversized(connection: Connection) -> dict[str, int]:
+    """Number of users per PII column whose token does not fit compact storage."""
+    from models import PII_TOKEN_BYTES
+
+    return _count_per_column(
+        connection, "users", f"LENGTH({_B64}) > {PII_TOKEN_BYTES}", _PII
+    )
+
+
+def compact_pending(connection: Connection) -> bool:
+    """Whether `compact prepare` ran and the cutover did not yet."""
+    return "lastname_bin" in {c["name"] for c in inspect(connection).get_columns("users")}
+
+
+def _report(counts: dict[str, int]) -> str:
+    return ", ".join(f"{column}: {count}" for column, count in counts.items())
+
+
+def compact_prepare(engine: Engine) -> None:
+    """Add the shadow columns and the triggers filling them on writes.
+
+    :raises RuntimeError: Raised (before any change) if some values are too long for compact storage
+    """
+    from models import MAX_PII_BYTES
+
+    with engine.connect() as connection:
+        oversized = compact_oversized(connection)
+    if oversized:
+        raise RuntimeError(
+            f"Values longer than {MAX_PII_BYTES} bytes must be shortened first ({_report(oversized)})."
+        )
+    with engine.begin() as connection:
+        for table in _COMPACT:
+            existing = {c["name"] for c in inspect(connection).get_columns(table)}
+            added = [
+                f"ADD COLUMN {column}_bin {sql_type} NULL"
+                for column, sql_type, _ in _compact_columns(table)
+                if f"{column}_bin" not in existing
+            ]
+            if added:
+                connection.exec_driver_sql(f"ALTER TABLE {table} {', '.join(added)}")
+            assignments = ", ".join(
+                f"NEW.{column}_bin = {expr.format('NEW.' + column)}"
+                for column, _, expr in _compact_columns(table)
+            )
+            for event in ("INSERT", "UPDATE"):
+                name = f"{table}_compact_{event.lower()}"
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+                connection.exec_driver_sql(
+                    f"CREATE TRIGGER {name} BEFORE {event} ON {table} "
+                    f"FOR EACH ROW SET {assignments}"
+                )
+
+
+def compact_backfill(engine: Engine, chunk_size: int = 1000) -> int:
+    """Fill the shadow columns of existing rows, one short transaction per chunk.
+
+    :return int: Number of rows converted
+    """
+    converted = 0
+    for table in _COMPACT:
+        assignments = ", ".join(
+            f"{column}_bin = {expr.format(column)}"
+            for column, _, expr in _compact_columns(table)
+        )
+        cursor = ""
+        while True:
+            with engine.begin() as connection:
+                keys = connection.scalars(
+                    text(f"SELECT uuid FROM {table} WHERE uuid > :cursor ORDER BY uuid LIMIT :limit"),
+                    {"cursor": cursor, "limit": chunk_size},
+                ).all()
+                if not keys:
+                    break
+                connection.execute(
+                    text(f"UPDATE {table} SET {assignments} WHERE uuid > :low AND uuid <= :high"),
+                    {"low": cursor, "high": keys[-1]},
+                )
+            converted += len(keys)
+            cursor = keys[-1]
+    return converted
+
+
+def compact_cutover(engine: Engine) -> None:
+    """Replace the text columns by their binary shadows (application stopped).
+
+    :raises RuntimeError: Raised (before any change) if some rows are not converted
+    """
+    from database import Base
+    import models  # noqa: F401  (register the tables)
+
+    with engine.connect() as connection:
+        missing = {}
+        for table in _COMPACT:
+            columns = [column for column, _, _ in _compact_columns(table)]
+            missing.update(
+                _count_per_column(
+                    connection, table, "{0}_bin IS NULL AND {0} IS NOT NULL", columns
+                )
+            )
+        oversized = compact_oversized(connection)
+    if missing:
+        raise RuntimeError(
+            f"Some rows are not converted, run `compact backfill` ({_report(missing)})"
+            + (f", values too long: {_report(oversized)}." if oversized else ".")
+        )
+    with engine.begin() as connection:
+        for table in _COMPACT:
+            for event in ("insert", "update"):
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_compact_{event}")
+        for table in ("tickets", "user_search_tokens"):
+            fk = _foreign_key(connection, table, "user_id")
+            if fk is not None:
+                connection.exec_driver_sql(f"ALTER TABLE {table} DROP FOREIGN KEY `{fk['name']}`")
+        # Search tokens are derived data without their own key, convert them in place.
+        connection.exec_driver_sql(
+            "ALTER TABLE user_search_tokens ADD COLUMN user_id_bin BINARY(16) NULL"
+        )
+        connection.exec_driver_sql("UPDATE user_search_tokens SET user_id_bin = UNHEX(user_id)")
+        connection.exec_driver_sql(
+            "ALTER TABLE user_search_tokens DROP PRIMARY KEY, DROP COLUMN user_id"
+        )
+        connection.exec_driver_sql(
+            "ALTER TABLE user_search_tokens "
+            "CHANGE COLUMN user_id_bin user_id BINARY(16) NOT NULL, "
+            "ADD PRIMARY KEY (user_id, field, token)"
+        )
+        for table in _COMPACT:
+            columns = list(_compact_columns(table))
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} DROP PRIMARY KEY, "
+                + ", ".join(f"DROP COLUMN {column}" for column, _, _ in columns)
+            )
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} "
+                + ", ".join(
+                    f"CHANGE COLUMN {column}_bin {column} {sql_type} NOT NULL"
+                    for column, sql_type, _ in columns
+                )
+                + ", ADD PRIMARY KEY (uuid)"
+            )
+            # Indexes over a dropped column lost it, rebuild them from the models.
+            converted = {column for column, _, _ in columns}
+            existing = {i["name"] for i in inspect(connection).get_indexes(table)}
+            for index in Base.metadata.tables[table].indexes:
+                if converted & {c.name for c in index.columns}:
+                    if index.name in existing:
+                        connection.exec_driver_sql(f"DROP INDEX `{index.name}` ON {table}")
+                    index.create(connection)
+        for table in ("tickets", "user_search_tokens"):
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD CONSTRAINT fk_{table}_user_id "
+                "FOREIGN KEY (user_id) REFERENCES users (uuid) ON DELETE CASCADE"
+            )
+
+
+_LOCK_NAME = "accounts_schema_migrations"
+_LOCK_TIMEOUT = 300
+
+
+@contextmanager
+def _migration_lock(engine: Engine):
+    """Serialize upgrades of instances starting together (MySQL named lock, held by its own connection)."""
+    if engine.dialect.name != "mysql":
+        yield
+        return
+    with engine.connect() as connection:
+        locked = connection.scalar(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": _LOCK_NAME, "timeout": _LOCK_TIMEOUT},
+        )
+        if locked != 1:
+            raise RuntimeError(f"Another instance is migrating the database (lock {_LOCK_NAME}).")
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _LOCK_NAME})
+
+
+def upgrade(engine: Engine) -> list[str]:
+    """Apply the pending migrations.
+
+    :param Engine engine: The engine of the database to migrate
+    :raises RuntimeError: Raised if another instance holds the migration lock for too long
+    :return list[str]: Names of the migrations applied
+    """
+    _metadata.create_all(bind=engine)
+    done = []
+    with _migration_lock(engine):
+        # Read under the lock: another instance may just have applied some.
+        with engine.connect() as connection:
+            applied = set(connection.scalars(select(schema_migrations.c.name)))
+        for name, fn in MIGRATIONS:
+            if name in applied:
+                continue
+            with engine.connect() as connection:
+                fn(connection)
+                connection.execute(
+                    schema_migrations.insert().values(
+                        name=name, applied_at=datetime.now(timezone.utc)
+                    )
+                )
+                connection.commit()
+            done.append(name)
+    return done
+
+
+def main() -> None:
+    parser = ArgumentParser(prog="python migrations.py", description="Database migrations.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("upgrade", help="Apply the pending migrations (default).")
+    compact = commands.add_parser("compact", help="Convert to COMPACT_STORAGE.")
+    compact.add_argument("step", choices=("prepare", "backfill", "cutover"))
+    compact.add_argument("--chunk-size", type=int, default=1000)
+    blind = commands.add_parser("blind-index", help="(Re)compute the users' blind indexes.")
+    blind.add_argument("--chunk-size", type=int, default=1000)
+    showings = commands.add_parser("showings", help="Fill the showing columns of older tickets.")
+    showings.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from database import Base, engine
+    import models  # noqa: F401  (register the tables)
+
+    if args.command == "compact":
+        try:
+            if args.step == "prepare":
+                compact_prepare(engine)
+            elif args.step == "backfill":
+                print(f"{compact_backfill(engine, args.chunk_size)} rows converted")
+            else:
+                compact_cutover(engine)
+        except RuntimeError as exc:
+            parser.exit(1, f"compact {args.step}: {exc}\n")
+        return
+    if args.command == "blind-index":
+        Base.metadata.create_all(bind=engine)
+        print(f"{blind_index_backfill(engine, args.chunk_size)} users indexed")
+        return
+    if args.command == "showings":
+        print(f"{showings_backfill(engine, args.chunk_size)} tickets converted")
+        return
+
+    Base.metadata.create_all(bind=engine)
+    for name in upgrade(engine) or ["(nothing to apply)"]:
+        print(name)
+
+
+if __name__ == "__main__":
+    main()
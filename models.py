@@ -1,34 +1,153 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Text
-from sqlalchemy.orm import relationship
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 
+from sqlalchemy import (
+    BINARY,
+    VARBINARY,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Row,
+    String,
+    Text,
+    TypeDecorator,
+    select,
+)
+from sqlalchemy.orm import Session, deferred, relationship, undefer_group
+
+from config import settings
 from database import Base
+from modules.Showings import MAX_LENGTH as SHOWING_LENGTH
+
+
+# Longest PII value (UTF-8 bytes) accepted with COMPACT_STORAGE, and the size of
+# its raw Fernet token: version + timestamp + IV + padded ciphertext + HMAC.
+MAX_PII_BYTES = 255
+PII_TOKEN_BYTES = 1 + 8 + 16 + (MAX_PII_BYTES // 16 + 1) * 16 + 32
+
+
+class EncryptedBinary(TypeDecorator):
+    """Fernet token stored as raw bytes, exposed as the usual base64 string."""
+
+    impl = VARBINARY
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else urlsafe_b64decode(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else urlsafe_b64encode(value).decode("ascii")
+
+
+class BinaryUUID(TypeDecorator):
+    """UUID stored as BINARY(16), exposed as the usual 32-character hex string."""
+
+    impl = BINARY
+    cache_ok = True
+
+    def __init__(self) -> None:
+        super().__init__(length=16)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            return b""  # not a uuid, matches no row
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value.hex()
+
+
+def key_type():
+    return BinaryUUID() if settings.compact_storage else String(32)
+
+
+def pii_type():
+    return EncryptedBinary(PII_TOKEN_BYTES) if settings.compact_storage else Text
 
 
 class User(Base):
     __tablename__ = "users"
 
-    uuid = Column(String(32), primary_key=True)
-    lastname = Column(Text, nullable=False)
-    firstname = Column(Text, nullable=False)
-    age = Column(Text, nullable=False)
-    email = Column(Text, nullable=False)
+    # PII blobs and the password hash are only loaded when asked for
+    # (see PROFILE), most handlers only need the role or tariff.
+    uuid = Column(key_type(), primary_key=True)
+    lastname = deferred(Column(pii_type(), nullable=False), group="profile")
+    firstname = deferred(Column(pii_type(), nullable=False), group="profile")
+    age = deferred(Column(pii_type(), nullable=False), group="profile")
+    email = deferred(Column(pii_type(), nullable=False), group="profile")
     email_hash = Column(String(64), nullable=False, index=True, unique=True)
-    password = Column(Text, nullable=False)
+    # Keyed HMAC of the normalized plaintexts (BLIND_INDEX_KEY), for admin search.
+    lastname_bidx = Column(String(32), nullable=True, index=True)
+    firstname_bidx = Column(String(32), nullable=True, index=True)
+    email_bidx = Column(String(32), nullable=True, index=True)
+    password = deferred(Column(Text, nullable=False))
     role = Column(String(10), nullable=False, default="user")
     tariff = Column(String(32), nullable=False, default="standard")
+    # Bumped on every role/tariff change, tokens carry the version they were issued for.
+    claims_version = Column(Integer, nullable=False, default=0, server_default="0")
 
+    # Tickets are removed by the database (ON DELETE CASCADE), deleting a
+    # user never loads them.
     tickets = relationship(
-        "Ticket", back_populates="user", cascade="all, delete-orphan"
+        "Ticket",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    __table_args__ = (
+        Index("ix_tickets_user_id_showing_start", "user_id", "showing_start"),
+        Index("ix_tickets_showing_id_showing_start", "showing_id", "showing_start"),
+    )
 
-    uuid = Column(String(32), primary_key=True)
-    showing = Column(Text, nullable=False)
-    user_id = Column(String(32), ForeignKey("users.uuid"), nullable=False)
+    # The showing is stored in indexed columns, `showing` only keeps the JSON of
+    # the other keys of an object showing (NULL when it was given as a string).
+    uuid = Column(key_type(), primary_key=True)
+    showing_id = Column(String(SHOWING_LENGTH), nullable=True)
+    showing_start = Column(DateTime, nullable=True)
+    showing_room = Column(String(SHOWING_LENGTH), nullable=True)
+    showing = Column(Text, nullable=True)
+    user_id = Column(
+        key_type(), ForeignKey("users.uuid", ondelete="CASCADE"), nullable=False
+    )
     tariff = Column(String(32), nullable=False, default="standard")
     price_cents = Column(Integer, nullable=False)
 
     user = relationship("User", back_populates="tickets")
+
+
+class SearchToken(Base):
+    """Blind index of a word prefix of a user field (BLIND_INDEX_PREFIXES)."""
+
+    __tablename__ = "user_search_tokens"
+
+    user_id = Column(
+        key_type(),
+        ForeignKey("users.uuid", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    field = Column(String(16), primary_key=True)
+    token = Column(String(32), primary_key=True, index=True)
+
+
+class TariffRecord(Base):
+    __tablename__ = "tariffs"
+
+    code = Column(String(32), primary_key=True)
+    label = Column(String(64), nullable=False)
+    price_cents = Column(Integer, nullable=False)
+
+
+PROFILE = undefer_group("profile")
+
+
+def user_fields(session: Session, uuid: str, *columns) -> Row | None:
+    """Load only some columns of a user (projection, no ORM object)."""
+    return session.execute(select(*columns).where(User.uuid == uuid)).first()
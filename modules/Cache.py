@@ -0,0 +1,253 @@
+from collections import OrderedDict, deque
+from collections.abc import Callable, Hashable
+from os import getpid
+from sys import getsizeof
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Any
+
+try:
+    import redis
+except ImportError:  # optional, only needed for a shared cache (REDIS_URL)
+    redis = None
+
+
+def deep_sizeof(value: Any) -> int:
+    """Approximate memory used by a value and the containers/strings it holds."""
+    size = getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+
+class TTLCache:
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 10000,
+        maxbytes: int = 0,
+        sizeof: Callable[[Any], int] = deep_sizeof,
+        sweep_interval: float = 0,
+    ) -> None:
+        """Thread-safe in-process cache whose entries expire after `ttl` seconds.
+
+        When full, the least recently used entry is evicted.
+
+        :param float ttl: Lifetime of an entry (seconds)
+        :param int maxsize: Maximum number of entries, defaults to 10000
+        :param int maxbytes: Maximum approximate size of the values (0 for no limit), defaults to 0
+        :param Callable sizeof: Size of a value, used with `maxbytes`, defaults to deep_sizeof
+        :param float sweep_interval: Drop expired entries every N seconds from a background thread,
+            even if the cache is idle (0 to only drop them on access), defaults to 0
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.sweep_interval = sweep_interval
+        self._lock = Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any, int]] = OrderedDict()
+        self._deadlines: deque[tuple[float, Hashable]] = deque()
+        self._bytes = 0
+        self._sweeper_pid: int | None = None
+        self._stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0}
+
+    def _pop(self, key: Hashable) -> None:
+        self._bytes -= self._entries.pop(key)[2]
+
+    def _expire(self, now: float) -> None:
+        # Deadlines are queued in insertion order and the TTL is fixed, so the
+        # expired entries are at the front; stale deadlines of re-set keys are skipped.
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, key = self._deadlines.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == deadline:
+                self._pop(key)
+                self._stats["expirations"] += 1
+
+    def _sweep(self) -> None:
+        while True:
+            sleep(self.sweep_interval)
+            with self._lock:
+                self._expire(monotonic())
+
+    def _start_sweeper(self) -> None:
+        # Threads do not survive a fork, start one in each process.
+        if self.sweep_interval > 0 and self._sweeper_pid != getpid():
+            self._sweeper_pid = getpid()
+            Thread(target=self._sweep, name="cache-sweeper", daemon=True).start()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            self._expire(monotonic())
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value) if self.maxbytes else 0
+        with self._lock:
+            self._start_sweeper()
+            now = monotonic()
+            self._expire(now)
+            if key in self._entries:
+                self._pop(key)
+            if self.maxbytes and size > self.maxbytes:
+                return
+            deadline = now + self.ttl
+            self._entries[key] = (deadline, value, size)
+            self._deadlines.append((deadline, key))
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (
+                self.maxbytes and self._bytes > self.maxbytes
+            ):
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+                self._stats["evictions"] += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._deadlines.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """Counters of this process's cache."""
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxsize": self.maxsize,
+                "maxbytes": self.maxbytes,
+                "ttl": self.ttl,
+            }
+
+
+class Generations:
+    def __init__(self, url: str, prefix: str, ttl: float) -> None:
+        """Generation counters shared by every worker through Redis.
+
+        Bumping the generation of a key invalidates the copies cached by all
+        workers, without the cached values ever leaving the process.
+
+        :param str url: Redis URL
+        :param str prefix: Prefix of the Redis keys
+        :param float ttl: Lifetime of the cached entries, counters outlive it
+        :raises RuntimeError: Raised if the redis package is not installed
+        """
+        if redis is None:
+            raise RuntimeError("The redis package is required to use REDIS_URL.")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+        self.expire = int(ttl) + 60
+
+    def get(self, key: str) -> int | None:
+        """Current generation, None if Redis cannot be reached."""
+        try:
+            return int(self.client.get(self.prefix + key) or 0)
+        except redis.RedisError:
+            return None
+
+    def bump(self, key: str) -> None:
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.incr(self.prefix + key).expire(self.prefix + key, self.expire).execute()
+        except redis.RedisError:
+            pass  # entries elsewhere expire after their TTL
+
+
+class Flags:
+    def __init__(self, url: str, prefix: str, ttl: float) -> None:
+        """Short-lived flags shared by every worker through Redis.
+
+        :param str url: Redis URL
+        :param str prefix: Prefix of the Redis keys
+        :param float ttl: Lifetime of a flag (seconds)
+        :raises RuntimeError: Raised if the redis package is not installed
+        """
+        if redis is None:
+            raise RuntimeError("The redis package is required to use REDIS_URL.")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+        self.ttl_ms = max(1, int(ttl * 1000))
+
+    def get(self, key: str) -> bool:
+        """Whether the flag is set, False if Redis cannot be reached."""
+        try:
+            return bool(self.client.exists(self.prefix + key))
+        except redis.RedisError:
+            return False
+
+    def set(self, key: str) -> None:
+        try:
+            self.client.set(self.prefix + key, 1, px=self.ttl_ms)
+        except redis.RedisError:
+            pass  # the flag only lives in this process
+
+
+class VersionedCache:
+    def __init__(self, cache: TTLCache, generations: Generations | None = None) -> None:
+        """TTL cache whose entries are also dropped when their generation is bumped.
+
+        Without `generations`, invalidations only reach this process's cache,
+        whose own counters outlive the entries like the shared ones.
+
+        :param TTLCache cache: Local storage of the entries
+        :param Generations | None generations: Shared generation counters, defaults to None
+        """
+        self.cache = cache
+        self.generations = generations
+        self._lock = Lock()
+        self._local = (
+            TTLCache(ttl=cache.ttl + 60, maxsize=cache.maxsize)
+            if generations is None
+            else None
+        )
+
+    def generation(self, key: str) -> int | None:
+        """Read before loading a value, so a concurrent invalidation is not missed."""
+        if self._local is not None:
+            return self._local.get(key, 0)
+        return self.generations.get(key)
+
+    def get(self, key: str, generation: int | None) -> Any:
+        if generation is None:
+            return None
+        entry = self.cache.get(key)
+        if entry is None or entry[0] != generation:
+            return None
+        return entry[1]
+
+    def set(self, key: str, value: Any, generation: int | None) -> None:
+        if generation is None or self.cache.ttl <= 0:
+            return
+        if self._local is None:
+            self.cache.set(key, (generation, value))
+            return
+        with self._lock:
+            # Loaded before an invalidation, the value is already stale.
+            if self._local.get(key, 0) == generation:
+                self.cache.set(key, (generation, value))
+
+    def invalidate(self, key: str) -> None:
+        if self._local is not None:
+            with self._lock:
+                self._local.set(key, self._local.get(key, 0) + 1)
+                self.cache.delete(key)
+            return
+        self.cache.delete(key)
+        self.generations.bump(key)
+
+    def stats(self) -> dict[str, Any]:
+        return {**self.cache.stats(), "shared": self.generations is not None}
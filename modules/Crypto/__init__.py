@@ -0,0 +1,3 @@
+from .blind import BlindIndex
+from .main import Cipher
+from .rotate import Reencryptor
@@ -0,0 +1,68 @@
+import hmac
+import re
+import unicodedata
+from hashlib import sha256
+
+
+_WORDS = re.compile(r"[^\W_]+")
+
+
+class BlindIndex:
+    def __init__(self, key: str, min_prefix: int = 3, max_prefix: int = 16) -> None:
+        """Keyed HMAC-SHA256 digests of normalized values, searchable without decrypting.
+
+        Each field has its own domain, equal values of different fields do not share a digest.
+
+        :param str key: The secret key, distinct from the encryption key
+        :param int min_prefix: Shortest word prefix indexed by `tokens`, defaults to 3
+        :param int max_prefix: Longest word prefix indexed by `tokens`, defaults to 16
+        :raises ValueError: Raised if the key is empty
+        """
+        if not key:
+            raise ValueError("The blind index key must not be empty.")
+        self.key = key.encode("utf-8")
+        self.min_prefix = min_prefix
+        self.max_prefix = max_prefix
+
+    @staticmethod
+    def normalize(value: str | int) -> str:
+        """Case, accent and whitespace insensitive form of a value."""
+        value = unicodedata.normalize("NFKD", str(value))
+        value = "".join(c for c in value if not unicodedata.combining(c))
+        return " ".join(value.casefold().split())
+
+    def _mac(self, domain: str, value: str) -> str:
+        message = f"{domain}\x00{value}".encode("utf-8")
+        return hmac.new(self.key, message, sha256).hexdigest()[:32]
+
+    def digest(self, field: str, value: str | int) -> str:
+        """Exact-match digest of a value.
+
+        :param str field: The field the value belongs to
+        :param str | int value: The plaintext
+        :return str: 32 hex characters
+        """
+        return self._mac(field, self.normalize(value))
+
+    def words(self, value: str | int) -> list[str]:
+        return _WORDS.findall(self.normalize(value))
+
+    def tokens(self, field: str, value: str | int) -> set[str]:
+        """Digests of every prefix (`min_prefix` to `max_prefix` long) of every word of a value.
+
+        :param str field: The field the value belongs to
+        :param str | int value: The plaintext
+        :return set[str]: The digests
+        """
+        return {
+            self._mac(f"{field}:prefix", word[:length])
+            for word in self.words(value)
+            for length in range(self.min_prefix, min(len(word), self.max_prefix) + 1)
+        }
+
+    def prefix(self, field: str, word: str) -> str | None:
+        """Digest to look a word prefix up with, None if it is shorter than `min_prefix`."""
+        word = self.normalize(word)[: self.max_prefix]
+        if len(word) < self.min_prefix:
+            return None
+        return self._mac(f"{field}:prefix", word)
@@ -0,0 +1,105 @@
+from collections.abc import Iterable, Sequence
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+from modules.Metrics import timed
+
+
+class Cipher:
+    def __init__(self, key: str, previous_keys: Iterable[str] = ()) -> None:
+        """Fernet cipher built once, with key rotation support.
+
+        New tokens are always encrypted with `key`; tokens made with one of
+        `previous_keys` can still be decrypted and rotated to `key`.
+
+        :param str key: The current key (32 Bytes URL-Safe Encoded Base64)
+        :param Iterable[str] previous_keys: Older keys still accepted for decryption, defaults to ()
+        :raises KeyError: Raised if one of the keys is not in a valid format
+        """
+        try:
+            self.primary = Fernet(key.encode("utf-8"))
+            older = [Fernet(k.encode("utf-8")) for k in previous_keys]
+        except ValueError as exc:
+            raise KeyError(
+                "The key is not in a valid format. (32 Bytes URL-Safe Encoded Base64)"
+            ) from exc
+        self.fernet = MultiFernet([self.primary, *older]) if older else None
+
+    def encrypt(self, message: str | int | float | bool) -> str:
+        """Encrypt a value by casting it to a string first.
+
+        :param str | int | float | bool message: The value to encrypt
+        :return str: The Fernet token
+        """
+        with timed("fernet"):
+            return self.primary.encrypt(str(message).encode("utf-8")).decode("utf-8")
+
+    def _decrypt(self, token: str) -> str | None:
+        try:
+            return (self.fernet or self.primary).decrypt(token.encode("utf-8")).decode("utf-8")
+        except InvalidToken:
+            return None
+
+    def decrypt(self, token: str) -> str | None:
+        """Decrypt a token.
+
+        :param str token: The Fernet token
+        :return str | None: The plaintext, or None if the token is invalid
+        """
+        with timed("fernet"):
+            return self._decrypt(token)
+
+    def encrypt_many(self, values: Iterable[str | int | float | bool]) -> list[str]:
+        """Encrypt several values at once (e.g. a whole row).
+
+        :param Iterable values: The values to encrypt
+        :return list[str]: The Fernet tokens, in the same order
+        """
+        encrypt = self.primary.encrypt
+        with timed("fernet"):
+            return [encrypt(str(value).encode("utf-8")).decode("utf-8") for value in values]
+
+    def decrypt_many(self, tokens: Iterable[str | None]) -> list[str | None]:
+        """Decrypt several tokens at once (e.g. a whole row).
+
+        :param Iterable[str | None] tokens: The Fernet tokens (None is passed through)
+        :return list[str | None]: The plaintexts (None for invalid tokens), in the same order
+        """
+        decrypt = self._decrypt
+        with timed("fernet"):
+            return [decrypt(token) if token is not None else None for token in tokens]
+
+    def decrypt_rows(self, rows: Iterable[Sequence[str | None]]) -> list[list[str | None]]:
+        """Decrypt a whole result set of encrypted columns.
+
+        :param Iterable[Sequence[str | None]] rows: Rows of Fernet tokens
+        :return list[list[str | None]]: Rows of plaintexts
+        """
+        decrypt = self._decrypt
+        with timed("fernet"):
+            return [
+                [decrypt(token) if token is not None else None for token in row]
+                for row in rows
+            ]
+
+    def is_current(self, token: str) -> bool:
+        """Check if a token was encrypted with the current key.
+
+        :param str token: The Fernet token
+        :return bool: True if the current key decrypts it
+        """
+        try:
+            self.primary.decrypt(token.encode("utf-8"))
+        except InvalidToken:
+            return False
+        return True
+
+    def rotate(self, token: str) -> str:
+        """Re-encrypt a token with the current key.
+
+        :param str token: The Fernet token
+        :raises InvalidToken: Raised if none of the keys decrypts it
+        :return str: The new token
+        """
+        if self.fernet is None:
+            return self.primary.encrypt(self.primary.decrypt(token.encode("utf-8"))).decode("utf-8")
+        return self.fernet.rotate(token.encode("utf-8")).decode("utf-8")
@@ -0,0 +1,100 @@
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from threading import Lock, Thread
+from time import sleep
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .main import Cipher
+
+
+class Reencryptor:
+    def __init__(self, cipher: Cipher, session_scope: Callable[[], AbstractContextManager[Session]], model: type, key: str, columns: list[str], chunk_size: int = 500, pause: float = 0.0) -> None:
+        """Background job re-encrypting a table with the current key.
+
+        The table is walked in chunks ordered by `key` (keyset pagination), each chunk
+        in its own transaction. Rows are updated conditionally on their old tokens, so
+        concurrent modifications are never overwritten (they already use the current key).
+
+        :param Cipher cipher: The cipher holding the current and previous keys
+        :param Callable session_scope: Transactional session scope (e.g. `get_session`)
+        :param type model: The mapped class to walk
+        :param str key: Name of the (unique, ordered) key column
+        :param list[str] columns: Names of the encrypted columns
+        :param int chunk_size: Rows per chunk, defaults to 500
+        :param float pause: Delay (seconds) between chunks, defaults to 0.0
+        """
+        self.cipher = cipher
+        self.session_scope = session_scope
+        self.model = model
+        self.key = key
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.pause = pause
+
+        self._lock = Lock()
+        self._thread: Thread | None = None
+        self._status = {"running": False, "scanned": 0, "rotated": 0, "conflicts": 0, "invalid": 0, "cursor": None, "error": None}
+
+    def start(self) -> bool:
+        """Start the job in a background thread.
+
+        :return bool: False if it is already running
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive(): return False
+            self._status.update(running=True, scanned=0, rotated=0, conflicts=0, invalid=0, cursor=None, error=None)
+            self._thread = Thread(target=self._run, name="reencrypt", daemon=True)
+            self._thread.start()
+        return True
+
+    def status(self) -> dict:
+        with self._lock: return dict(self._status)
+
+    def _chunk(self, session: Session, cursor: str | None) -> list:
+        key = getattr(self.model, self.key)
+        stmt = select(key, *(getattr(self.model, c) for c in self.columns)).order_by(key).limit(self.chunk_size)
+        if cursor is not None: stmt = stmt.where(key > cursor)
+        return session.execute(stmt).all()
+
+    def run(self) -> None:
+        """Walk the whole table synchronously."""
+        key = getattr(self.model, self.key)
+        cursor = None
+        while True:
+            with self.session_scope() as session:
+                rows = self._chunk(session, cursor)
+                if not rows: break
+                rotated = conflicts = invalid = 0
+                for row in rows:
+                    old = dict(zip(self.columns, row[1:]))
+                    values = {}
+                    for column, token in old.items():
+                        if token is None or self.cipher.is_current(token): continue
+                        try: values[column] = self.cipher.rotate(token)
+                        except InvalidToken: invalid += 1
+                    if not values: continue
+                    result = session.execute(
+                        update(self.model)
+                        .where(key == row[0], *(getattr(self.model, c) == old[c] for c in values))
+                        .values(**values)
+                    )
+                    if result.rowcount: rotated += 1
+                    else: conflicts += 1
+                cursor = rows[-1][0]
+            with self._lock:
+                self._status["scanned"] += len(rows)
+                self._status["rotated"] += rotated
+                self._status["conflicts"] += conflicts
+                self._status["invalid"] += invalid
+                self._status["cursor"] = cursor
+            if self.pause: sleep(self.pause)
+
+    def _run(self) -> None:
+        try: self.run()
+        except Exception as exc:
+            with self._lock: self._status["error"] = repr(exc)
+        finally:
+            with self._lock: self._status["running"] = False
@@ -1 +1,3 @@
-from .main import Hasher
\ No newline at end of file
+from .main import Hasher
+from .pool import HashPool, HasherBusy
+from .rehash import RehashQueue
\ No newline at end of file
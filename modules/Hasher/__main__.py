@@ -0,0 +1,39 @@
+from argparse import ArgumentParser
+
+from .calibrate import benchmark, calibrate, load_profile, p95, save_profile
+from .main import CUSTOM_ARGON_PROFILE
+
+
+def main() -> None:
+    parser = ArgumentParser(prog="python -m modules.Hasher", description="Argon2 calibration and benchmark.")
+    parser.add_argument("--path", default="hasher_profiles.json", help="Profiles file (default: hasher_profiles.json)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cal = commands.add_parser("calibrate", help="Benchmark this host and save a named profile.")
+    cal.add_argument("name")
+    cal.add_argument("--target-ms", type=float, default=250)
+    cal.add_argument("--max-memory-mib", type=int, default=256)
+    cal.add_argument("--parallelism", type=int, default=None)
+    cal.add_argument("--samples", type=int, default=5)
+
+    bench = commands.add_parser("benchmark", help="Benchmark a saved profile (or the default one).")
+    bench.add_argument("name", nargs="?", default="")
+    bench.add_argument("--samples", type=int, default=10)
+
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        params = calibrate(args.target_ms, args.max_memory_mib * 1024, args.parallelism, args.samples)
+        version = save_profile(args.name, params, args.path)
+        print(f"Saved profile '{args.name}' v{version}: time_cost={params.time_cost} memory_cost={params.memory_cost} KiB parallelism={params.parallelism}")
+        return
+
+    params = load_profile(args.name, args.path) if args.name else CUSTOM_ARGON_PROFILE
+    if params is None: parser.error(f"profile '{args.name}' not found in {args.path}")
+    timings = benchmark(params, args.samples)
+    print(f"time_cost={params.time_cost} memory_cost={params.memory_cost} KiB parallelism={params.parallelism}")
+    print(f"min={min(timings):.1f} ms p95={p95(timings):.1f} ms max={max(timings):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from dataclasses import replace
+from datetime import datetime, timezone
+from json import dump, load
+from math import ceil
+from os import cpu_count
+from os.path import exists
+from secrets import token_urlsafe
+from time import perf_counter
+import argon2
+
+from .main import CUSTOM_ARGON_PROFILE
+
+
+MAX_TIME_COST = 10
+
+
+def benchmark(params: argon2.Parameters, samples: int = 5) -> list[float]:
+    """Time a few hashes with the given parameters.
+
+    :param argon2.Parameters params: The Argon2 parameters to benchmark
+    :param int samples: Number of hashes to time, defaults to 5
+    :return list[float]: The latency (in milliseconds) of each hash
+    """
+    argon = argon2.PasswordHasher.from_parameters(params)
+    timings = []
+    for _ in range(samples):
+        password = token_urlsafe(16)
+        start = perf_counter()
+        argon.hash(password)
+        timings.append((perf_counter() - start) * 1000)
+    return timings
+
+
+def p95(timings: list[float]) -> float:
+    """95th percentile (nearest rank) of a list of timings."""
+    ordered = sorted(timings)
+    return ordered[max(0, ceil(0.95 * len(ordered)) - 1)]
+
+
+def calibrate(target_ms: float, max_memory_kib: int, parallelism: int | None = None, samples: int = 5, base: argon2.Parameters = CUSTOM_ARGON_PROFILE) -> argon2.Parameters:
+    """Pick the strongest parameters whose p95 hash latency fits in the target on this host.
+
+    Memory is tried from the ceiling downwards (halving) with `time_cost=1`,
+    then `time_cost` is raised as long as the target still holds.
+    Salt/hash lengths, type and version are kept from `base`.
+
+    :param float target_ms: Target p95 latency of a single hash (milliseconds)
+    :param int max_memory_kib: Memory ceiling of a single hash (KiB)
+    :param int | None parallelism: Lanes to use, defaults to the CPU count (capped to the base profile)
+    :param int samples: Hashes timed per candidate, defaults to 5
+    :param argon2.Parameters base: Profile to derive from, defaults to CUSTOM_ARGON_PROFILE
+    :return argon2.Parameters: The calibrated parameters
+    """
+    lanes = parallelism or min(cpu_count() or 1, base.parallelism)
+    min_memory = 8 * lanes
+    params = replace(base, time_cost=1, memory_cost=max(min_memory, max_memory_kib), parallelism=lanes)
+
+    while p95(benchmark(params, samples)) > target_ms and params.memory_cost > min_memory:
+        params = replace(params, memory_cost=max(min_memory, params.memory_cost // 2))
+
+    while params.time_cost < MAX_TIME_COST:
+        candidate = replace(params, time_cost=params.time_cost + 1)
+        if p95(benchmark(candidate, samples)) > target_ms: break
+        params = candidate
+    return params
+
+
+_STORED = ("time_cost", "memory_cost", "parallelism", "salt_len", "hash_len")
+
+
+def save_profile(name: str, params: argon2.Parameters, path: str) -> int:
+    """Persist parameters as a named profile in a JSON file (other profiles are kept).
+
+    Each save of a profile bumps its version, so the file shipped to every node
+    of a deployment identifies the parameters it was calibrated with.
+
+    :param str name: The name of the profile
+    :param argon2.Parameters params: The parameters to save
+    :param str path: Path of the profiles file
+    :return int: The version of the saved profile
+    """
+    profiles = {}
+    if exists(path):
+        with open(path, encoding="utf-8") as file: profiles = load(file)
+    version = profiles.get(name, {}).get("version", 0) + 1
+    profiles[name] = {
+        "version": version,
+        "calibrated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "time_cost": params.time_cost,
+        "memory_cost": params.memory_cost,
+        "parallelism": params.parallelism,
+        "salt_len": params.salt_len,
+        "hash_len": params.hash_len,
+    }
+    with open(path, "w", encoding="utf-8") as file: dump(profiles, file, indent=2)
+    return version
+
+
+def load_profile(name: str, path: str) -> argon2.Parameters | None:
+    """Load a named profile.
+
+    :param str name: The name of the profile
+    :param str path: Path of the profiles file
+    :return argon2.Parameters | None: The parameters, or None if the profile does not exist
+    """
+    if not exists(path): return None
+    with open(path, encoding="utf-8") as file: profiles = load(file)
+    if name not in profiles: return None
+    return replace(CUSTOM_ARGON_PROFILE, **{key: profiles[name][key] for key in _STORED})
+
+
+def resolve_profile(name: str, path: str) -> argon2.Parameters:
+    """Parameters to hash with at startup, never calibrated here: every node of a
+    deployment must share the profiles file made by `python -m modules.Hasher calibrate`.
+
+    :param str name: The profile name, empty to use CUSTOM_ARGON_PROFILE
+    :param str path: Path of the profiles file
+    :raises RuntimeError: Raised if the profile does not exist
+    :return argon2.Parameters: The parameters
+    """
+    if not name: return CUSTOM_ARGON_PROFILE
+    params = load_profile(name, path)
+    if params is None:
+        raise RuntimeError(f"Hasher profile '{name}' not found in {path}, calibrate it with `python -m modules.Hasher calibrate {name}`.")
+    return params
@@ -1,6 +1,10 @@
 from hashlib import md5
 import argon2
 
+from modules.Metrics import timed
+
+from .pool import HashPool, hash_job, verify_job
+
 
 CUSTOM_ARGON_PROFILE = argon2.Parameters(
     time_cost=1,
@@ -15,32 +19,60 @@ CUSTOM_ARGON_PROFILE = argon2.Parameters(
 
 
 class Hasher:
-    def __init__(self, params: argon2.Parameters = CUSTOM_ARGON_PROFILE) -> None:
+    def __init__(self, params: argon2.Parameters = CUSTOM_ARGON_PROFILE, pool: HashPool | None = None) -> None:
         """Create an Argon2 Haser using te specified parameters (or default ones).
 
         :param argon2.Parameters params: The Argon2 parameters to load, defaults to CUSTOM_ARGON_PROFILE 
+        :param HashPool | None pool: Pool to run the Argon2 work in, defaults to None (inline)
         """
         self.params = params
+        self.pool = pool
         self.argon = argon2.PasswordHasher.from_parameters(self.params)
     
+    def _memory_cost(self, hash: str) -> int:
+        try: return argon2.extract_parameters(hash).memory_cost
+        except: return self.params.memory_cost
+    
     def hash(self, password: str) -> str:
         """Hashes a password.
 
         :param str password: Password to hash
+        :raises HasherBusy: Raised if the pool is saturated
         :return str: Hashed password
         """
-        return self.argon.hash(password)
+        with timed("argon2"):
+            if self.pool: return self.pool.run(self.params.memory_cost, hash_job, self.params, password)
+            return self.argon.hash(password)
     
     def verify(self, hash: str, password: str) -> bool:
         """Verify if the hash and password corresponds.
 
         :param str hash: The hash to check against
         :param str password: The password to check
+        :raises HasherBusy: Raised if the pool is saturated
         :return bool: True if they correspond, else False
         """
-        try: isValid = self.argon.verify(hash, password)
-        except: isValid = False
-        return isValid
+        with timed("argon2"):
+            if self.pool: return self.pool.run(self._memory_cost(hash), verify_job, self.params, hash, password)
+            try: isValid = self.argon.verify(hash, password)
+            except: isValid = False
+            return isValid
+    
+    def needs_rehash(self, hash: str) -> bool:
+        """Check if a hash was made with other parameters than the current ones.
+
+        :param str hash: The hash to check
+        :return bool: True if it should be rehashed
+        """
+        return self.argon.check_needs_rehash(hash)
+    
+    def phc_prefix(self) -> str:
+        """Prefix shared by every hash made with the current parameters.
+
+        :return str: The PHC string prefix (e.g. '$argon2id$v=19$m=65536,t=3,p=4$')
+        """
+        p = self.params
+        return f"$argon2{p.type.name.lower()}$v={p.version}$m={p.memory_cost},t={p.time_cost},p={p.parallelism}$"
     
     def rehash(self, hash: str, password: str) -> str:
         """Automatically rehashes a password if needed.
@@ -49,7 +81,7 @@ class Hasher:
         :param str password: The password
         :return str: The new hash if it needed to be rehashed, else the one provided.
         """
-        needsRehash = self.argon.check_needs_rehash(hash)
+        needsRehash = self.needs_rehash(hash)
         if needsRehash: return self.hash(password)
         else: return hash
     
@@ -0,0 +1,196 @@
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from math import ceil
+from multiprocessing import get_context
+from os import cpu_count, getpid
+from threading import Condition
+from time import monotonic
+from typing import Any
+import argon2
+
+
+_ARGONS: dict[tuple, argon2.PasswordHasher] = {}
+
+
+def _argon(params: argon2.Parameters) -> argon2.PasswordHasher:
+    """Return a PasswordHasher for the parameters, cached per worker process."""
+    key = (
+        params.type, params.version, params.salt_len, params.hash_len,
+        params.time_cost, params.memory_cost, params.parallelism,
+    )
+    argon = _ARGONS.get(key)
+    if argon is None:
+        argon = _ARGONS[key] = argon2.PasswordHasher.from_parameters(params)
+    return argon
+
+
+def hash_job(params: argon2.Parameters, password: str) -> str:
+    return _argon(params).hash(password)
+
+
+def verify_job(params: argon2.Parameters, hash: str, password: str) -> bool:
+    try: return _argon(params).verify(hash, password)
+    except Exception: return False
+
+
+def pool_size(memory_budget_kib: int, job_memory_kib: int | None = None) -> int:
+    """Default number of worker processes of a HashPool.
+
+    :param int memory_budget_kib: Total memory (KiB) concurrent jobs may use
+    :param int | None job_memory_kib: Memory cost of a typical job, defaults to None
+    :return int: The number of `job_memory_kib` jobs fitting in the budget, at most the CPU count
+    """
+    size = cpu_count() or 1
+    if job_memory_kib:
+        size = max(1, min(size, memory_budget_kib // job_memory_kib))
+    return size
+
+
+class HasherBusy(RuntimeError):
+    def __init__(self, retry_after: int) -> None:
+        """Raised when the hashing pool cannot admit a job in time.
+
+        :param int retry_after: Suggested delay (in seconds) before retrying
+        """
+        super().__init__("Password hashing capacity exhausted, retry later.")
+        self.retry_after = retry_after
+
+
+class HashPool:
+    def __init__(self, memory_budget_kib: int, queue_size: int = 16, queue_timeout: float = 5.0, max_workers: int | None = None, start_method: str = "forkserver", job_memory_kib: int | None = None) -> None:
+        """Process pool running Argon2 jobs under a memory budget.
+
+        The pool and its budget belong to one process: each gunicorn worker has its own.
+        A job is admitted only if its memory cost fits in what is left of the budget
+        (a single job is always admitted on an idle pool, even if it exceeds the budget).
+        Other jobs wait in a bounded queue and are admitted in arrival order; when the
+        queue is full, or the wait exceeds `queue_timeout`, `HasherBusy` is raised instead.
+
+        :param int memory_budget_kib: Total memory (KiB) concurrent jobs of this process may use
+        :param int queue_size: Maximum number of jobs waiting for admission, defaults to 16
+        :param float queue_timeout: Maximum wait (seconds) for admission, defaults to 5.0
+        :param int | None max_workers: Worker processes, defaults to the number of
+            `job_memory_kib` jobs fitting in the budget, at most the CPU count
+        :param str start_method: Multiprocessing start method, defaults to "forkserver"
+            (app workers run threads, forking them could inherit held locks)
+        :param int | None job_memory_kib: Memory cost of a typical job, defaults to None
+        """
+        self.memory_budget_kib = memory_budget_kib
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_workers = max_workers or pool_size(memory_budget_kib, job_memory_kib)
+        self.start_method = start_method
+
+        self._cond = Condition()
+        self._executor: ProcessPoolExecutor | None = None
+        self._pid: int | None = None
+        self._memory_in_use = 0
+        self._running = 0
+        self._queue: deque[object] = deque()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._job_avg = 0.0
+
+    def _fits(self, memory_kib: int) -> bool:
+        if self._running == 0:
+            return True
+        return self._running < self.max_workers and \
+            self._memory_in_use + memory_kib <= self.memory_budget_kib
+
+    def _retry_after(self) -> int:
+        per_job = self._job_avg or 1.0
+        return max(1, ceil(per_job * (len(self._queue) + 1) / max(1, self._running)))
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # The executor is (re)created lazily so that forked app workers get their own.
+        if self._executor is None or self._pid != getpid():
+            context = get_context(self.start_method)
+            if self.start_method == "forkserver":
+                # Argon2 is loaded once in the server. Each worker still re-imports
+                # the entry script (__main__), which must not build the application.
+                context.set_forkserver_preload([__name__])
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+            )
+            self._pid = getpid()
+        return self._executor
+
+    def run(self, memory_kib: int, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a job in the pool once enough of the memory budget is free.
+
+        :param int memory_kib: Memory (KiB) the job needs
+        :param Callable fn: Picklable, module-level function to run
+        :raises HasherBusy: Raised if the queue is full, admission timed out or a worker died
+        :return Any: The job's result
+        """
+        start = monotonic()
+        with self._cond:
+            # First come, first served: a job that fits still waits behind the queue.
+            if self._queue or not self._fits(memory_kib):
+                if len(self._queue) >= self.queue_size:
+                    self._rejected += 1
+                    raise HasherBusy(self._retry_after())
+                ticket = object()
+                self._queue.append(ticket)
+                try:
+                    deadline = start + self.queue_timeout
+                    while self._queue[0] is not ticket or not self._fits(memory_kib):
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            self._timed_out += 1
+                            raise HasherBusy(self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+            waited = monotonic() - start
+            self._running += 1
+            self._memory_in_use += memory_kib
+            self._admitted += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            executor = self._get_executor()
+
+        started = monotonic()
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed), start a fresh pool for the next jobs.
+            with self._cond:
+                if self._executor is executor:
+                    self._executor = None
+                retry_after = self._retry_after()
+            raise HasherBusy(retry_after) from None
+        finally:
+            elapsed = monotonic() - started
+            with self._cond:
+                self._running -= 1
+                self._memory_in_use -= memory_kib
+                self._job_avg = elapsed if not self._job_avg else 0.8 * self._job_avg + 0.2 * elapsed
+                self._cond.notify_all()
+
+    def stats(self) -> dict[str, int | float]:
+        """Snapshot of the admission queue and wait-time statistics.
+
+        :return dict[str, int | float]: The current statistics
+        """
+        with self._cond:
+            return {
+                "memory_budget_kib": self.memory_budget_kib,
+                "memory_in_use_kib": self._memory_in_use,
+                "running": self._running,
+                "queued": len(self._queue),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+                "wait_seconds_avg": round(self._wait_total / self._admitted, 6) if self._admitted else 0.0,
+                "job_seconds_avg": round(self._job_avg, 6),
+            }
@@ -0,0 +1,117 @@
+from collections.abc import Callable
+from os import getpid
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import sleep
+
+from .main import Hasher
+
+
+REHASH_MODES = {"off", "opportunistic", "bulk"}
+
+
+class RehashQueue:
+    def __init__(self, hasher: Hasher, persist: Callable[[str, str, str], bool], mode: str = "opportunistic", size: int = 64, attempts: int = 3, backoff: float = 1.0, workers: int = 1) -> None:
+        """Background queue rehashing passwords outside of the login request.
+
+        `persist(key, old_hash, new_hash)` must store the new hash only if the stored one
+        is still `old_hash` (conditional update) and return whether a row was updated.
+        Plaintexts wait in memory until their job runs and are hashed once: a failed
+        hash is dropped (the next login queues it again), only `persist` is retried.
+
+        Modes:
+        - "off": never rehash.
+        - "opportunistic": rehash only when the hasher pool has no queued work.
+        - "bulk": rehash every outdated hash on the next login (profile migration).
+
+        :param Hasher hasher: The hasher computing the new hashes
+        :param Callable[[str, str, str], bool] persist: Callback storing a new hash
+        :param str mode: The rehash mode, defaults to "opportunistic"
+        :param int size: Maximum number of pending jobs, defaults to 64
+        :param int attempts: Attempts to store a new hash, defaults to 3
+        :param float backoff: Base delay (seconds) between attempts, doubled each time, defaults to 1.0
+        :param int workers: Worker threads, defaults to 1
+        :raises ValueError: Raised if the mode is unknown
+        """
+        if mode not in REHASH_MODES:
+            raise ValueError(f"Invalid rehash mode '{mode}'. Allowed values: {', '.join(sorted(REHASH_MODES))}.")
+        self.hasher = hasher
+        self.persist = persist
+        self.mode = mode
+        self.attempts = attempts
+        self.backoff = backoff
+        self.workers = workers
+
+        self._queue: Queue[tuple[str, str, str]] = Queue(maxsize=size)
+        self._lock = Lock()
+        self._pending: set[str] = set()
+        self._pid: int | None = None
+        self._counters = dict.fromkeys(
+            ("submitted", "skipped", "dropped", "migrated", "stale", "retried", "failed"), 0
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock: self._counters[name] += 1
+
+    def _start(self) -> None:
+        # Threads do not survive a fork, start them lazily in each process.
+        if self._pid == getpid(): return
+        self._pid = getpid()
+        for _ in range(self.workers):
+            Thread(target=self._work, name="rehash-worker", daemon=True).start()
+
+    def submit(self, key: str, hash: str, password: str) -> bool:
+        """Queue a rehash if the hash is outdated.
+
+        :param str key: Key identifying the stored hash (e.g. the user uuid)
+        :param str hash: The current (verified) hash
+        :param str password: The password matching the hash
+        :return bool: True if a job was queued
+        """
+        if self.mode == "off" or not self.hasher.needs_rehash(hash): return False
+        if self.mode == "opportunistic" and self.hasher.pool and self.hasher.pool.stats()["queued"]:
+            self._count("skipped")
+            return False
+        with self._lock:
+            self._start()
+            if key in self._pending: return False
+            try: self._queue.put_nowait((key, hash, password))
+            except Full:
+                self._counters["dropped"] += 1
+                return False
+            self._pending.add(key)
+            self._counters["submitted"] += 1
+        return True
+
+    def _work(self) -> None:
+        while True:
+            key, hash, password = self._queue.get()
+            try:
+                try: new_hash = self.hasher.hash(password)
+                except Exception:
+                    self._count("failed")
+                    continue
+                finally: password = None
+                for attempt in range(self.attempts):
+                    try:
+                        updated = self.persist(key, hash, new_hash)
+                    except Exception:
+                        if attempt + 1 == self.attempts:
+                            self._count("failed")
+                            break
+                        self._count("retried")
+                        sleep(self.backoff * 2 ** attempt)
+                        continue
+                    self._count("migrated" if updated else "stale")
+                    break
+            finally:
+                with self._lock: self._pending.discard(key)
+                self._queue.task_done()
+
+    def stats(self) -> dict[str, int | str]:
+        """Counters of the queue.
+
+        :return dict[str, int | str]: The mode, pending jobs and counters
+        """
+        with self._lock:
+            return {"mode": self.mode, "pending": len(self._pending), **self._counters}
@@ -0,0 +1,177 @@
+import json
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getpid, listdir, makedirs, path, remove, replace
+from secrets import token_hex
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+
+PHASES = ("db", "argon2", "fernet", "serialize")
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds spent in each phase by the current request, None outside of requests.
+_current: ContextVar[dict[str, float] | None] = ContextVar("metrics", default=None)
+_began: ContextVar[float] = ContextVar("metrics_began", default=0.0)
+
+
+def start() -> None:
+    """Start timing the current request."""
+    _current.set(dict.fromkeys(PHASES, 0.0))
+    _began.set(perf_counter())
+
+
+def add(phase: str, seconds: float) -> None:
+    """Charge time to a phase of the current request (ignored outside of requests)."""
+    phases = _current.get()
+    if phases is not None:
+        phases[phase] += seconds
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Charge the time spent in the block to a phase of the current request."""
+    phases = _current.get()
+    if phases is None:
+        yield
+        return
+    begin = perf_counter()
+    try:
+        yield
+    finally:
+        phases[phase] += perf_counter() - begin
+
+
+class Histograms:
+    def __init__(self, directory: str = "", flush_interval: float = 5) -> None:
+        """Latency histograms of this process, optionally shared with sibling worker processes.
+
+        Each process writes its snapshot to its own file in `directory`, and
+        `render` adds up every file, so any worker can serve the totals.
+
+        :param str directory: Where the processes write their snapshots ("" for this process only), defaults to ""
+        :param float flush_interval: Seconds between two snapshots, defaults to 5
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = Lock()
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        self._pid: int | None = None
+        self._file = ""
+
+    def observe(self, labels: tuple[str, ...], seconds: float) -> None:
+        """Record one observation, `labels` is (metric, endpoint, method[, phase])."""
+        with self._lock:
+            self._start_flusher()
+            self._observe(labels, seconds)
+
+    def _observe(self, labels: tuple[str, ...], seconds: float) -> None:
+        row = self._series.get(labels)
+        if row is None:
+            row = self._series[labels] = [0.0] * (len(BUCKETS) + 3)
+        row[bisect_left(BUCKETS, seconds)] += 1
+        row[-2] += seconds
+        row[-1] += 1
+
+    def record(self, endpoint: str, method: str) -> None:
+        """Record the request timed since `start`, and its phase breakdown."""
+        phases = _current.get()
+        if phases is None:
+            return
+        _current.set(None)
+        total = perf_counter() - _began.get()
+        with self._lock:
+            self._start_flusher()
+            self._observe(("request", endpoint, method), total)
+            for phase, seconds in phases.items():
+                self._observe(("phase", endpoint, method, phase), seconds)
+
+    def snapshot(self) -> dict[tuple[str, ...], list[float]]:
+        with self._lock:
+            return {labels: list(row) for labels, row in self._series.items()}
+
+    def _start_flusher(self) -> None:
+        # Threads do not survive a fork, each worker starts its own (lock held).
+        if not self.directory or self._pid == getpid():
+            return
+        self._pid = getpid()
+        # Series inherited from the parent are already counted in its file.
+        self._series = {}
+        self._file = path.join(self.directory, f"{self._pid}-{token_hex(4)}.json")
+        Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this process's snapshot to its file (kept after exit, counters never go back)."""
+        if not self.directory or self._pid != getpid():
+            return
+        rows = [[*labels, row] for labels, row in self.snapshot().items()]
+        temporary = self._file + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(rows, file, separators=(",", ":"))
+        replace(temporary, self._file)
+
+    def _collect(self) -> dict[tuple[str, ...], list[float]]:
+        totals = self.snapshot()
+        if not self.directory:
+            return totals
+        for name in listdir(self.directory):
+            if not name.endswith(".json") or path.join(self.directory, name) == self._file:
+                continue
+            try:
+                with open(path.join(self.directory, name), encoding="utf-8") as file:
+                    rows = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for *labels, row in rows:
+                current = totals.setdefault(tuple(labels), [0.0] * len(row))
+                for index, value in enumerate(row):
+                    current[index] += value
+        return totals
+
+    def render(self, prefix: str = "app") -> str:
+        """All processes' histograms in the Prometheus text format (0.0.4)."""
+        series = sorted(self._collect().items())
+        lines = []
+        for metric, help_text in (
+            ("request", "Request duration by endpoint."),
+            ("phase", "Time spent in db, argon2, fernet and serialize per request."),
+        ):
+            name = f"{prefix}_{metric}_duration_seconds"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, row in series:
+                if labels[0] != metric:
+                    continue
+                keys = ("endpoint", "method", "phase")[: len(labels) - 1]
+                label_text = ",".join(
+                    f'{key}="{_escape(value)}"' for key, value in zip(keys, labels[1:])
+                )
+                cumulative = 0.0
+                for bound, count in zip((*BUCKETS, "+Inf"), row[:-2]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative:g}')
+                lines.append(f"{name}_sum{{{label_text}}} {row[-2]:.6f}")
+                lines.append(f"{name}_count{{{label_text}}} {row[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def reset_directory(directory: str, keep: Iterable[str] = ()) -> None:
+    """Create the snapshot directory, dropping the files of a previous run."""
+    makedirs(directory, exist_ok=True)
+    for name in listdir(directory):
+        if name.endswith((".json", ".tmp")) and name not in keep:
+            try:
+                remove(path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,117 @@
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
+from typing import Any
+
+from flask import Response, stream_with_context
+from sqlalchemy import Select
+from sqlalchemy.orm import Session
+
+from modules.Responses import MIMETYPE, dumps
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_CHUNK = 500
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+@dataclass(frozen=True)
+class Page:
+    limit: int
+    cursor: str | None
+    stream: str | None
+
+
+def parse_page(args: Mapping[str, str]) -> Page:
+    """Read the `limit`, `cursor` and `stream` query parameters.
+
+    :param Mapping[str, str] args: The query parameters
+    :raises ValueError: Raised if a parameter is invalid
+    :return Page: The requested page
+    """
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("Invalid value: limit") from None
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"Invalid value: limit (1 to {MAX_LIMIT}).")
+    stream = args.get("stream") or None
+    if stream not in {None, "json", "ndjson"}:
+        raise ValueError("Invalid value: stream. Allowed values: 'json', 'ndjson'.")
+    return Page(limit=limit, cursor=args.get("cursor") or None, stream=stream)
+
+
+def keyset(stmt: Select, key: Any, page: Page) -> Select:
+    """Restrict a statement to the requested page, ordered by a unique key.
+
+    One extra row is fetched to know if there is a next page.
+    Streamed pages are not limited.
+
+    :param Select stmt: The statement to paginate
+    :param Any key: The unique key column to order by
+    :param Page page: The requested page
+    :return Select: The paginated statement
+    """
+    if page.cursor is not None:
+        stmt = stmt.where(key > page.cursor)
+    stmt = stmt.order_by(key)
+    return stmt if page.stream else stmt.limit(page.limit + 1)
+
+
+def split(items: list, page: Page, key: Callable[[Any], str]) -> tuple[list, str | None]:
+    """Trim the extra row fetched by `keyset` and compute the next cursor.
+
+    :param list items: The fetched rows
+    :param Page page: The requested page
+    :param Callable key: Returns the key of a row
+    :return tuple[list, str | None]: The rows of the page and the next cursor (None on the last page)
+    """
+    if len(items) <= page.limit:
+        return items, None
+    items = items[:page.limit]
+    return items, key(items[-1])
+
+
+def stream(session_scope: Callable[[], AbstractContextManager[Session]], stmt: Select, name: str, serialize: Callable[[Any], dict], page: Page) -> Response:
+    """Stream the rows of a statement from a server-side cursor.
+
+    With `page.stream == "ndjson"` each row is one JSON line, otherwise the
+    body is the usual `{"status": 200, "data": {name: [...], "next_cursor": null}}`
+    document (a stream runs to the last row, there is no next page).
+
+    :param Callable session_scope: Transactional session scope (e.g. `get_session`)
+    :param Select stmt: The statement to stream (see `keyset`)
+    :param str name: Name of the list in the JSON document
+    :param Callable serialize: Turns a row into a JSON-serializable dict
+    :param Page page: The requested page
+    :return Response: The streamed response
+    """
+    ndjson = page.stream == "ndjson"
+
+    def generate() -> Iterator[bytes]:
+        if not ndjson:
+            yield b'{"status":200,"data":{%s:[' % dumps(name)
+        first = True
+        buffer: list[bytes] = []
+        with session_scope() as session:
+            for row in session.scalars(stmt.execution_options(yield_per=STREAM_CHUNK)):
+                line = dumps(serialize(row))
+                if ndjson:
+                    buffer.append(line + b"\n")
+                else:
+                    buffer.append(line if first else b"," + line)
+                    first = False
+                if len(buffer) >= STREAM_CHUNK:
+                    yield b"".join(buffer)
+                    buffer.clear()
+        if buffer:
+            yield b"".join(buffer)
+        if not ndjson:
+            yield b'],"next_cursor":null}}'
+
+    return Response(
+        stream_with_context(generate()),
+        status=200,
+        mimetype=NDJSON_MIMETYPE if ndjson else MIMETYPE,
+    )
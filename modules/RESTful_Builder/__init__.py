@@ -1 +1 @@
-from .main import Builder
\ No newline at end of file
+from .main import Builder, query_budget, read_only, requested_fields
\ No newline at end of file
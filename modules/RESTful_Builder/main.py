@@ -1,7 +1,53 @@
-from collections.abc import Callable
-from flask import Blueprint
+from collections.abc import Callable, Sequence
+from flask import Blueprint, g, request
 from typing import Any
 
+
+def read_only(callback: Callable) -> Callable:
+    """Declare a callback as read-only, its database sessions may then be served by a read replica.
+
+    :param Callable callback: The callback to declare
+    :return Callable: The same callback
+    """
+    callback.read_only = True
+    return callback
+
+
+def query_budget(statements: int) -> Callable:
+    """Declare how many SQL statements a callback may run (see DB_QUERY_ACCOUNTING).
+
+    :param int statements: The budget, authentication included
+    :return Callable: The decorator
+    """
+    def decorator(callback: Callable) -> Callable:
+        callback.query_budget = statements
+        return callback
+    return decorator
+
+
+def requested_fields(available: Sequence[str]) -> list[str]:
+    """Fields selected with `?fields=a,b` (all of `available` when absent), in the order of `available`.
+
+    :param Sequence[str] available: Fields the resource can return
+    :raises ValueError: Raised if an unknown field is requested
+    :return list[str]: The fields to return
+    """
+    fields = g.get('fields')
+    if fields is None:
+        return list(available)
+    unknown = sorted(fields.difference(available))
+    if unknown:
+        raise ValueError(f"Unknown field(s): [{', '.join(unknown)}]. Allowed values: {', '.join(available)}.")
+    return [field for field in available if field in fields]
+
+
+def _call(callback: Callable, *args: Any) -> Any:
+    g.read_only = getattr(callback, 'read_only', False)
+    g.query_budget = getattr(callback, 'query_budget', None)
+    fields = request.args.get('fields')
+    g.fields = frozenset(f.strip() for f in fields.split(',') if f.strip()) if fields is not None else None
+    return callback(*args)
+
 class Builder:
     def __init__(self, name: str) -> None:
         """RESTful Builder, helper class to create a RESTful endpoint.
@@ -11,12 +57,14 @@ class Builder:
         self.name = name.split('/')[-1]
         self.bp = Blueprint(self.name, __name__)
     
-    def bind(self, login: Callable | None = None, refresh: Callable | None = None, getAll: Callable | None = None, getMe: Callable | None = None, getOne: Callable[[str], Any] | None = None, create: Callable | None = None, modify: Callable[[str], Any] | None = None, delete: Callable[[str | None], Any] | None = None) -> 'Builder':
+    def bind(self, login: Callable | None = None, refresh: Callable | None = None, getAll: Callable | None = None, search: Callable | None = None, getMe: Callable | None = None, getOne: Callable[[str], Any] | None = None, create: Callable | None = None, batch: Callable | None = None, modify: Callable[[str], Any] | None = None, delete: Callable[[str | None], Any] | None = None) -> 'Builder':
         """Binds all endpoints in one function.
 
         :param Callable | None getAll: Callback to get all resources.
+        :param Callable | None search: Callback to search resources.
         :param Callable | None getOne: Callback to get one resource.
         :param Callable | None create: Callback to create a resource.
+        :param Callable | None batch: Callback to create several resources at once.
         :param Callable | None modify: Callback to modify a resource.
         :param Callable | None delete: Callback to delete a resource.
         :param Callable | None login: Callback to login.
@@ -24,35 +72,43 @@ class Builder:
         """
         if login:
             @self.bp.post('/login')
-            def w0() -> dict: return login()
+            def w0() -> dict: return _call(login)
         if refresh:
             @self.bp.get('/refresh')
-            def w1() -> dict: return refresh()
+            def w1() -> dict: return _call(refresh)
         if getAll:
-            @self.bp.get('/')
-            def w2() -> dict: return getAll()
+            @self.bp.get('/', strict_slashes=False)
+            def w2() -> dict: return _call(getAll)
+        if search:
+            @self.bp.get('/search')
+            def w9() -> dict: return _call(search)
         if getMe:
             @self.bp.get('/me')
-            def w3() -> dict: return getMe()
+            def w3() -> dict: return _call(getMe)
         if getOne:
             @self.bp.get('/<id>')
-            def w4(id: Any) -> dict: return getOne(id)
+            def w4(id: Any) -> dict: return _call(getOne, id)
         if create:
             @self.bp.post('/')
-            def w5() -> dict: return create()
+            def w5() -> dict: return _call(create)
+        if batch:
+            @self.bp.post('/batch')
+            def w8() -> dict: return _call(batch)
         if modify:
             @self.bp.put('/<id>')
             @self.bp.patch('/<id>')
-            def w6(id: Any) -> dict: return modify(id)
+            def w6(id: Any) -> dict: return _call(modify, id)
         if delete:
             @self.bp.delete('/')
             @self.bp.delete('/<id>')
-            def w7(id: Any | None = None) -> dict: return delete(id)
+            def w7(id: Any | None = None) -> dict: return _call(delete, id)
         if not login and \
            not getAll and \
+           not search and \
            not getMe and \
            not getOne and \
            not create and \
+           not batch and \
            not modify and \
            not delete: raise RuntimeError('You need to bind at least one of the callbacks.')
         return self
@@ -62,8 +118,8 @@ class Builder:
 
         :param Callable callback: Callback to execute.
         """
-        @self.bp.get('/')
-        def wrapper(): return callback()
+        @self.bp.get('/', strict_slashes=False)
+        def wrapper(): return _call(callback)
         return self
     
     def getOne(self, callback: Callable) -> 'Builder':
@@ -72,7 +128,7 @@ class Builder:
         :param Callable callback: Callback to execute.
         """
         @self.bp.get('/<id>')
-        def wrapper(id: Any): return callback(id)
+        def wrapper(id: Any): return _call(callback, id)
         return self
     
     def create(self, callback: Callable) -> 'Builder':
@@ -81,7 +137,7 @@ class Builder:
         :param Callable callback: Callback to execute.
         """
         @self.bp.post('/')
-        def wrapper(): return callback()
+        def wrapper(): return _call(callback)
         return self
     
     def modify(self, callback: Callable) -> 'Builder':
@@ -91,7 +147,7 @@ class Builder:
         """
         @self.bp.put('/<id>')
         @self.bp.patch('/<id>')
-        def wrapper(id: Any): return callback(id)
+        def wrapper(id: Any): return _call(callback, id)
         return self
     
     def delete(self, callback: Callable) -> 'Builder':
@@ -100,5 +156,5 @@ class Builder:
         :param Callable callback: Callback to execute.
         """
         @self.bp.delete('/<id>')
-        def wrapper(id: Any): return callback(id)
+        def wrapper(id: Any): return _call(callback, id)
         return self
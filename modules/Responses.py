@@ -0,0 +1,158 @@
+import gzip
+import json
+from collections.abc import Mapping
+from datetime import date, datetime
+from http import HTTPStatus
+from typing import Any
+
+from flask import Response
+from flask.json.provider import JSONProvider
+from werkzeug.datastructures import Accept
+
+from modules.Metrics import timed
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+
+MIMETYPE = "application/json"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Mapping):  # e.g. the read-only tariff mappings
+        return dict(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(value: Any) -> bytes:
+        """Serialize a value to compact UTF-8 JSON."""
+        with timed("serialize"):
+            return orjson.dumps(value, default=_default)
+
+    loads = orjson.loads
+else:
+    BACKEND = "json"
+    _encoder = json.JSONEncoder(
+        separators=(",", ":"), ensure_ascii=False, default=_default
+    )
+
+    def dumps(value: Any) -> bytes:
+        """Serialize a value to compact UTF-8 JSON."""
+        with timed("serialize"):
+            return _encoder.encode(value).encode("utf-8")
+
+    loads = json.loads
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider on top of `dumps` (dicts returned by views, `jsonify`, `request.json`)."""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return Response(dumps(obj), mimetype=MIMETYPE)
+
+
+def send(
+    code: int, response: Any = None, headers: Mapping[str, str] | None = None
+) -> Response:
+    """Success response: `{"status": code, "data": response}`.
+
+    :param int code: HTTP status
+    :param Any response: The data, omitted if None, defaults to None
+    :param Mapping | None headers: Extra headers, defaults to None
+    :return Response: The response
+    """
+    payload = {"status": code} if response is None else {"status": code, "data": response}
+    return Response(dumps(payload), status=code, mimetype=MIMETYPE, headers=headers)
+
+
+def abort(
+    code: int,
+    message: str,
+    headers: Mapping[str, str] | None = None,
+    **details: Any,
+) -> Response:
+    """Error response: `{"status": code, "error": <reason>, "message": message, **details}`.
+
+    :param int code: HTTP status
+    :param str message: Explanation for the client
+    :param Mapping | None headers: Extra headers (e.g. Retry-After), defaults to None
+    :return Response: The response
+    """
+    payload = {
+        "status": code,
+        "error": HTTPStatus(code).phrase,
+        "message": message,
+        **details,
+    }
+    return Response(dumps(payload), status=code, mimetype=MIMETYPE, headers=headers)
+
+
+COMPRESSIBLE = {MIMETYPE, "application/x-ndjson"}
+
+
+def compress(
+    response: Response, accept_encodings: Accept, min_bytes: int = 1024, level: int = 5
+) -> Response:
+    """Compress a JSON body with the best encoding the client accepts (br, then gzip).
+
+    Streamed, small or already encoded bodies are left untouched.
+
+    :param Response response: The response
+    :param Accept accept_encodings: The request's Accept-Encoding
+    :param int min_bytes: Smallest body worth compressing, defaults to 1024
+    :param int level: gzip level (brotli quality is derived from it), defaults to 5
+    :return Response: The same response
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype not in COMPRESSIBLE
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.content_length is not None and response.content_length < min_bytes:
+        return response
+
+    encoding = None
+    if brotli is not None and accept_encodings["br"]:
+        encoding = "br"
+    elif accept_encodings["gzip"]:
+        encoding = "gzip"
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    if encoding == "br":
+        body = brotli.compress(body, quality=min(11, level))
+    else:
+        body = gzip.compress(body, compresslevel=level, mtime=0)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    # The representation changed, a strong validator would now be wrong.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from json import dumps, loads
+
+
+MAX_LENGTH = 128
+
+# Keys of an object showing stored in their own columns.
+_ID, _START, _ROOM = "id", "start", "room"
+_NO_EXTRAS = "{}"
+
+
+def parse_start(value: str, naive: bool = False) -> datetime:
+    """Parse an ISO 8601 date with a UTC offset, stored as naive UTC.
+
+    :param str value: The date
+    :param bool naive: Accept dates without offset as UTC (legacy rows), defaults to False
+    :raises ValueError: Raised if the date is invalid or has no offset
+    :return datetime: The date
+    """
+    if not isinstance(value, str):
+        raise ValueError("Invalid value: start")
+    try:
+        start = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("Invalid value: start") from None
+    if start.tzinfo is None:
+        if not naive:
+            raise ValueError("Invalid value: start (UTC offset required, e.g. Z)")
+        return start
+    return start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def format_start(start: datetime) -> str:
+    """ISO 8601 date with an explicit UTC offset, naive dates being UTC."""
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return start.astimezone(timezone.utc).isoformat()
+
+
+def _label(value, name: str) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"Invalid value: {name}")
+    value = str(value)
+    if not value or len(value) > MAX_LENGTH:
+        raise ValueError(f"Invalid value: {name} (1 to {MAX_LENGTH} characters)")
+    return value
+
+
+def split(showing: dict | str, naive: bool = False) -> dict:
+    """Split a showing into the columns of a ticket.
+
+    A string is the showing id, an object may have an `id`, a `start` date and a
+    `room`, its other keys are kept as JSON in `showing`.
+
+    :param dict | str showing: The showing, as sent by the client
+    :param bool naive: Accept a `start` without offset as UTC (see `parse_start`), defaults to False
+    :raises ValueError: Raised if the showing is invalid
+    :return dict: `showing_id`, `showing_start`, `showing_room` and `showing`
+    """
+    if isinstance(showing, str):
+        return {
+            "showing_id": _label(showing, "showing"),
+            "showing_start": None,
+            "showing_room": None,
+            "showing": None,
+        }
+    if not isinstance(showing, dict):
+        raise ValueError("Invalid value: showing")
+    extras = {k: v for k, v in showing.items() if k not in (_ID, _START, _ROOM)}
+    start = showing.get(_START)
+    return {
+        "showing_id": _label(showing.get(_ID), _ID),
+        "showing_start": None if start is None else parse_start(start, naive),
+        "showing_room": _label(showing.get(_ROOM), _ROOM),
+        "showing": dumps(extras, separators=(",", ":")) if extras else _NO_EXTRAS,
+    }
+
+
+def join(
+    showing_id: str | None,
+    showing_start: datetime | None,
+    showing_room: str | None,
+    showing: str | None,
+) -> dict | str | None:
+    """Rebuild the showing sent by the client from the columns of a ticket."""
+    if showing is None:
+        return showing_id
+    try:
+        payload = {} if showing == _NO_EXTRAS else loads(showing)
+    except ValueError:
+        return showing  # legacy label, not converted yet (`migrations.py showings`)
+    if isinstance(payload, str):
+        return payload  # legacy label too long for `showing_id`
+    if showing_id is not None:
+        payload[_ID] = showing_id
+    if showing_start is not None:
+        payload[_START] = format_start(showing_start)
+    if showing_room is not None:
+        payload[_ROOM] = showing_room
+    return payload
+
+
+def split_legacy(showing: str) -> dict:
+    """Columns of a ticket stored before the showing columns existed."""
+    try:
+        value = loads(showing)
+    except ValueError:
+        value = showing
+    try:
+        return split(value, naive=True)
+    except ValueError:
+        # Kept verbatim, it is only returned to the client.
+        return {
+            "showing_id": None,
+            "showing_start": None,
+            "showing_room": None,
+            "showing": dumps(value, separators=(",", ":")),
+        }
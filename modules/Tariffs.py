@@ -1,5 +1,8 @@
+from collections.abc import Iterable, Mapping
 from dataclasses import dataclass
-from typing import Iterable
+from hashlib import sha256
+from json import dumps, load
+from types import MappingProxyType
 
 
 @dataclass(frozen=True)
@@ -9,31 +12,105 @@ class Tariff:
     price_cents: int
 
 
-_TARIFFS: dict[str, Tariff] = {
-    "standard": Tariff("standard", "Plein tarif", 1200),
-    "student": Tariff("student", "Etudiant", 900),
-    "under16": Tariff("under16", "Moins de 16 ans", 700),
-    "unemployed": Tariff("unemployed", "Demandeur d'emploi", 800),
-}
+@dataclass(frozen=True)
+class Catalog:
+    """Immutable snapshot of the tariffs, with its pre-serialized API response."""
+
+    tariffs: Mapping[str, Tariff]
+    serialized: Mapping[str, Mapping[str, int | str]]
+    body: bytes
+    etag: str
+
 
 DEFAULT_TARIFF = "standard"
 
+_DEFAULT_TARIFFS = (
+    Tariff("standard", "Plein tarif", 1200),
+    Tariff("student", "Etudiant", 900),
+    Tariff("under16", "Moins de 16 ans", 700),
+    Tariff("unemployed", "Demandeur d'emploi", 800),
+)
+
+
+def build(tariffs: Iterable[Tariff]) -> Catalog:
+    """Build a catalog snapshot.
+
+    :param Iterable[Tariff] tariffs: The tariffs
+    :raises ValueError: Raised if the default tariff is missing
+    :return Catalog: The snapshot
+    """
+    by_code = {tariff.code.strip().lower(): tariff for tariff in tariffs}
+    if DEFAULT_TARIFF not in by_code:
+        raise ValueError(f"The default tariff '{DEFAULT_TARIFF}' is missing.")
+    serialized = {
+        code: MappingProxyType({"label": tariff.label, "price_cents": tariff.price_cents})
+        for code, tariff in by_code.items()
+    }
+    body = dumps(
+        {"status": 200, "data": {"tariffs": {code: dict(v) for code, v in serialized.items()}}},
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return Catalog(
+        tariffs=MappingProxyType(by_code),
+        serialized=MappingProxyType(serialized),
+        body=body,
+        etag=sha256(body).hexdigest()[:32],
+    )
+
+
+# Readers only ever dereference this name once, and reloads rebind it to a new
+# snapshot, so no locking is needed.
+_CATALOG = build(_DEFAULT_TARIFFS)
+
+
+def catalog() -> Catalog:
+    return _CATALOG
+
+
+def install(tariffs: Iterable[Tariff]) -> Catalog:
+    """Atomically replace the current catalog.
+
+    :param Iterable[Tariff] tariffs: The new tariffs
+    :raises ValueError: Raised if the default tariff is missing
+    :return Catalog: The new snapshot
+    """
+    global _CATALOG
+    _CATALOG = build(tariffs)
+    return _CATALOG
+
+
+def defaults() -> tuple[Tariff, ...]:
+    return _DEFAULT_TARIFFS
+
+
+def load_file(path: str) -> list[Tariff]:
+    """Read tariffs from a JSON file shaped like `serialize_all()`.
+
+    :param str path: Path of the file
+    :return list[Tariff]: The tariffs
+    """
+    with open(path, encoding="utf-8") as file:
+        data = load(file)
+    return [
+        Tariff(code, values["label"], int(values["price_cents"]))
+        for code, values in data.items()
+    ]
+
 
 def available_codes() -> Iterable[str]:
-    return _TARIFFS.keys()
+    return _CATALOG.tariffs.keys()
 
 
 def get_tariff(code: str | None) -> Tariff:
+    tariffs = _CATALOG.tariffs
     normalized = (code or DEFAULT_TARIFF).strip().lower()
-    if normalized not in _TARIFFS:
+    if normalized not in tariffs:
         raise KeyError(
-            f"Invalid tariff '{code}'. Allowed values: {', '.join(_TARIFFS)}."
+            f"Invalid tariff '{code}'. Allowed values: {', '.join(tariffs)}."
         )
-    return _TARIFFS[normalized]
+    return tariffs[normalized]
 
 
-def serialize_all() -> dict[str, dict[str, int | str]]:
-    return {
-        code: {"label": tariff.label, "price_cents": tariff.price_cents}
-        for code, tariff in _TARIFFS.items()
-    }
+def serialize_all() -> Mapping[str, Mapping[str, int | str]]:
+    return _CATALOG.serialized
@@ -0,0 +1,194 @@
+from threading import Lock
+from time import time
+
+from modules.Cache import TTLCache, redis
+
+
+_STORE_ERRORS = (redis.RedisError,) if redis is not None else ()
+
+
+class MemoryStore:
+    def __init__(self, maxsize: int = 100000, window: float = 900) -> None:
+        """Throttling state of this process only.
+
+        :param int maxsize: Maximum number of keys tracked per kind of state, defaults to 100000
+        :param float window: How long failures are remembered (seconds), defaults to 900
+        """
+        self._lock = Lock()
+        self._buckets = TTLCache(ttl=window, maxsize=maxsize)
+        self._failures = TTLCache(ttl=window, maxsize=maxsize)
+
+    def take(self, key: str, capacity: float, per_second: float) -> float:
+        with self._lock:
+            now = time()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * per_second)
+            if tokens < 1:
+                self._buckets.set(key, (tokens, now))
+                return (1 - tokens) / per_second
+            self._buckets.set(key, (tokens - 1, now))
+            return 0.0
+
+    def blocked(self, key: str) -> float:
+        with self._lock:
+            _, until = self._failures.get(key, (0, 0.0))
+        return max(0.0, until - time())
+
+    def fail(self, key: str, base: float, maximum: float) -> float:
+        with self._lock:
+            count, _ = self._failures.get(key, (0, 0.0))
+            delay = min(maximum, base * 2 ** count)
+            self._failures.set(key, (count + 1, time() + delay))
+        return delay
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._failures.delete(key)
+
+
+# KEYS[1]: bucket; ARGV: capacity, tokens per second, now, expiry (s).
+# Returns the wait in milliseconds (0 when a token was taken).
+_TAKE = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = math.ceil((1 - tokens) / rate * 1000)
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return wait
+"""
+
+
+class RedisStore:
+    def __init__(self, url: str, prefix: str = "throttle:", window: float = 900) -> None:
+        """Throttling state shared by every worker through Redis.
+
+        :param str url: Redis URL
+        :param str prefix: Prefix of the Redis keys, defaults to "throttle:"
+        :param float window: How long failures are remembered (seconds), defaults to 900
+        :raises RuntimeError: Raised if the redis package is not installed
+        """
+        if redis is None:
+            raise RuntimeError("The redis package is required to use REDIS_URL.")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+        self.window = int(window)
+        self._take = self.client.register_script(_TAKE)
+
+    def take(self, key: str, capacity: float, per_second: float) -> float:
+        wait = self._take(
+            keys=[f"{self.prefix}bucket:{key}"],
+            args=[capacity, per_second, time(), self.window],
+        )
+        return int(wait) / 1000
+
+    def blocked(self, key: str) -> float:
+        ttl = self.client.pttl(f"{self.prefix}blocked:{key}")
+        return max(0, ttl) / 1000
+
+    def fail(self, key: str, base: float, maximum: float) -> float:
+        count = self.client.incr(f"{self.prefix}failures:{key}")
+        self.client.expire(f"{self.prefix}failures:{key}", self.window)
+        delay = min(maximum, base * 2 ** (count - 1))
+        self.client.set(f"{self.prefix}blocked:{key}", 1, px=max(1, int(delay * 1000)))
+        return delay
+
+    def reset(self, key: str) -> None:
+        self.client.delete(f"{self.prefix}failures:{key}", f"{self.prefix}blocked:{key}")
+
+
+class LoginThrottle:
+    def __init__(
+        self,
+        store: MemoryStore | RedisStore,
+        ip_per_minute: float,
+        ip_burst: int,
+        account_per_minute: float,
+        account_burst: int,
+        backoff_base: float,
+        backoff_max: float,
+    ) -> None:
+        """Token buckets per client IP and per account, plus an exponential backoff after failures.
+
+        Checked before any password hash is verified, so rejected attempts cost no Argon2 work.
+
+        :param MemoryStore | RedisStore store: Where the state is kept
+        :param float ip_per_minute: Sustained attempts per minute of a client IP
+        :param int ip_burst: Attempts a client IP may make at once
+        :param float account_per_minute: Sustained attempts per minute on an account
+        :param int account_burst: Attempts an account may receive at once
+        :param float backoff_base: Lockout after the first failure (seconds), doubled after each one
+        :param float backoff_max: Longest lockout (seconds)
+        """
+        self.store = store
+        self.ip = (ip_burst, ip_per_minute / 60)
+        self.account = (account_burst, account_per_minute / 60)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = Lock()
+        self._stats = {
+            "admitted": 0,
+            "rejected_backoff": 0,
+            "rejected_ip": 0,
+            "rejected_account": 0,
+            "failures": 0,
+            "store_errors": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def check(self, ip: str | None, account: str) -> float:
+        """Admit an attempt or tell how long to wait.
+
+        :param str | None ip: Client IP
+        :param str account: Account key (e.g. the email hash)
+        :return float: 0 if admitted, else seconds before retrying
+        """
+        try:
+            wait = self.store.blocked(account)
+            if wait:
+                self._count("rejected_backoff")
+                return wait
+            wait = self.store.take(f"ip:{ip}", *self.ip)
+            if wait:
+                self._count("rejected_ip")
+                return wait
+            wait = self.store.take(f"account:{account}", *self.account)
+            if wait:
+                self._count("rejected_account")
+                return wait
+        except _STORE_ERRORS:
+            # An unreachable shared store must not lock everybody out.
+            self._count("store_errors")
+        self._count("admitted")
+        return 0.0
+
+    def failed(self, account: str) -> None:
+        self._count("failures")
+        try:
+            self.store.fail(account, self.backoff_base, self.backoff_max)
+        except _STORE_ERRORS:
+            self._count("store_errors")
+
+    def succeeded(self, account: str) -> None:
+        try:
+            self.store.reset(account)
+        except _STORE_ERRORS:
+            self._count("store_errors")
+
+    def stats(self) -> dict[str, int | str]:
+        """Counters of this process."""
+        with self._lock:
+            return {
+                **self._stats,
+                "store": "redis" if isinstance(self.store, RedisStore) else "memory",
+            }
@@ -0,0 +1,65 @@
+from collections.abc import Iterable, Sequence
+from secrets import token_hex
+from threading import Lock
+from time import time
+
+from modules.Cache import redis
+
+
+class LocalVersions:
+    def __init__(self) -> None:
+        """Version counters of this process only (a single worker).
+
+        The epoch changes at every start, so validators handed out by a
+        previous process never match.
+        """
+        self.epoch = token_hex(8)
+        self._lock = Lock()
+        self._versions: dict[str, tuple[int, float]] = {}
+
+    def get(self, keys: Sequence[str]) -> tuple[str, list[tuple[int, float]]]:
+        """Epoch, then the counter and last bump time of each key ((0, 0.0) if never bumped)."""
+        with self._lock:
+            return self.epoch, [self._versions.get(key, (0, 0.0)) for key in keys]
+
+    def bump(self, keys: Iterable[str]) -> None:
+        now = time()
+        with self._lock:
+            for key in keys:
+                count, _ = self._versions.get(key, (0, now))
+                self._versions[key] = (count + 1, now)
+
+
+class RedisVersions:
+    def __init__(self, url: str, prefix: str = "version:") -> None:
+        """Version counters shared by every worker through Redis.
+
+        :param str url: Redis URL
+        :param str prefix: Prefix of the Redis keys, defaults to "version:"
+        :raises RuntimeError: Raised if the redis package is not installed
+        """
+        if redis is None:
+            raise RuntimeError("The redis package is required to use REDIS_URL.")
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, keys: Sequence[str]) -> tuple[str, list[tuple[int, float]]]:
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(f"{self.prefix}epoch")
+            for key in keys:
+                pipe.hmget(self.prefix + key, "n", "at")
+            epoch, *rows = pipe.execute()
+        if epoch is None:
+            # Redis lost its data: a new epoch, so reset counters cannot match old validators.
+            self.client.set(f"{self.prefix}epoch", token_hex(8), nx=True)
+            return self.get(keys)
+        return epoch.decode("ascii"), [
+            (int(count or 0), float(at or 0)) for count, at in rows
+        ]
+
+    def bump(self, keys: Iterable[str]) -> None:
+        now = time()
+        with self.client.pipeline() as pipe:
+            for key in keys:
+                pipe.hincrby(self.prefix + key, "n", 1).hset(self.prefix + key, "at", now)
+            pipe.execute()
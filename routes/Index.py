@@ -1,14 +1,11 @@
 from os.path import join, isdir
 from flask import Blueprint
-from http import HTTPStatus
 from os import listdir
 
-
-bp = Blueprint('index', __name__)
+from modules.Responses import send
 
 
-def send(code: int, response: dict | None = None): return {'status': code, 'data': response} if response is not None else {'status': code}
-def abort(code: int, message: str): return {'status': code, 'error': HTTPStatus(code).phrase, 'message': message}
+bp = Blueprint('index', __name__)
 
 
 @bp.get('/')
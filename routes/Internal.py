@@ -0,0 +1,96 @@
+from flask import Blueprint, Response, current_app, request
+from hmac import compare_digest
+
+from config import settings
+from database import pool_stats, query_stats
+from modules.Responses import abort, send
+
+
+bp = Blueprint('internal', __name__)
+
+
+@bp.before_request
+def guard():
+    # The client address proves nothing behind a local reverse proxy, only the token does.
+    if not settings.internal_token:
+        return abort(403, 'Internal routes are disabled (INTERNAL_TOKEN).')
+    token = request.headers.get('X-Internal-Token', '')
+    if not compare_digest(token, settings.internal_token):
+        return abort(403, 'Internal token required.')
+
+
+@bp.get('/hasher')
+def hasher():
+    from routes.v1.Users import HASHER
+    return send(200, {
+        'pool': HASHER.pool.stats() if HASHER.pool else None
+    })
+
+
+@bp.get('/rehash')
+def rehash():
+    from routes.v1.Users import rehash_stats
+    return send(200, rehash_stats())
+
+
+@bp.get('/crypto/rotate')
+def rotation_status():
+    from routes.v1.Users import REENCRYPTOR
+    return send(200, REENCRYPTOR.status())
+
+
+@bp.post('/crypto/rotate')
+def rotation_start():
+    from routes.v1.Users import REENCRYPTOR
+    if not REENCRYPTOR.start():
+        return abort(409, 'Re-encryption is already running.')
+    return send(202, REENCRYPTOR.status())
+
+
+@bp.post('/tariffs/reload')
+def tariffs_reload():
+    from routes.v1.Tariffs import reload
+    try:
+        current = reload()
+    except (OSError, ValueError, KeyError) as exc:
+        return abort(500, f'Tariffs could not be reloaded: {exc}')
+    # Only this worker is reloaded, the others follow within TARIFFS_RELOAD_INTERVAL.
+    return send(200, {
+        'etag': current.etag,
+        'tariffs': list(current.tariffs),
+        'reload_interval': settings.tariffs_reload_interval
+    })
+
+
+@bp.get('/pool')
+def pool():
+    return send(200, pool_stats())
+
+
+@bp.get('/queries')
+def queries():
+    return send(200, query_stats())
+
+
+@bp.get('/cache')
+def cache():
+    from auth import CLAIMS_CACHE
+    from routes.v1.Users import PROFILE_CACHE
+    return send(200, {
+        'claims': CLAIMS_CACHE.stats(),
+        'profiles': PROFILE_CACHE.stats()
+    })
+
+
+@bp.get('/throttle')
+def throttle():
+    from routes.v1.Users import THROTTLE
+    return send(200, THROTTLE.stats())
+
+
+@bp.get('/metrics')
+def metrics():
+    histograms = current_app.extensions.get('metrics')
+    if histograms is None:
+        return abort(404, 'Metrics are disabled (METRICS=false).')
+    return Response(histograms.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,82 @@
+from os import getpid
+from threading import Lock, Thread
+from time import sleep
+
+from flask import Response, request
+from sqlalchemy import select
+
+from config import settings
+from database import get_session
+from models import TariffRecord
+from modules.RESTful_Builder import Builder
+from modules.Tariffs import Catalog, Tariff, catalog, defaults, install, load_file
+
+
+_watcher_lock = Lock()
+_watcher_pid: int | None = None
+
+
+def _load_db() -> list[Tariff]:
+    with get_session() as session:
+        records = session.scalars(select(TariffRecord)).all()
+        if not records:
+            session.add_all(
+                TariffRecord(code=t.code, label=t.label, price_cents=t.price_cents)
+                for t in defaults()
+            )
+            return list(defaults())
+        return [Tariff(r.code, r.label, r.price_cents) for r in records]
+
+
+def reload() -> Catalog:
+    """Reload the tariffs from the configured source (builtin, file or db)."""
+    if settings.tariffs_source == "file":
+        return install(load_file(settings.tariffs_file))
+    if settings.tariffs_source == "db":
+        return install(_load_db())
+    return install(defaults())
+
+
+def _watch() -> None:
+    while True:
+        sleep(settings.tariffs_reload_interval)
+        try:
+            reload()
+        except Exception:
+            pass  # keep serving the last good snapshot
+
+
+def start_watcher() -> None:
+    """Reload the tariffs periodically (once per process, threads do not survive a fork).
+
+    This is how a reload reaches every worker: `POST /internal/tariffs/reload`
+    only applies to the worker serving it.
+    """
+    global _watcher_pid
+    if (
+        settings.tariffs_reload_interval <= 0
+        or settings.tariffs_source == "builtin"
+        or _watcher_pid == getpid()
+    ):
+        return
+    with _watcher_lock:
+        if _watcher_pid == getpid():
+            return
+        _watcher_pid = getpid()
+        Thread(target=_watch, name="tariffs-reload", daemon=True).start()
+
+
+def getAll():
+    current = catalog()
+    if request.if_none_match.contains_weak(current.etag):
+        response = Response(status=304)
+    else:
+        response = Response(current.body, status=200, mimetype="application/json")
+    response.set_etag(current.etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+bp = Builder("v1-tariffs").bind(
+    getAll=getAll,
+).bp
@@ -1,88 +1,135 @@
-import json
-
-from flask import jsonify, request
+from flask import request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from http import HTTPStatus
+from functools import partial
 from uuid import uuid4
 
-from sqlalchemy import delete as sql_delete, select
+from sqlalchemy import delete as sql_delete, insert, literal, select
+from sqlalchemy.orm import load_only
 
+from auth import claims_required, current_claims
+from config import settings
 from database import get_session
 from models import Ticket, User
-from modules.RESTful_Builder import Builder
+from modules import Showings
+from modules.Pagination import keyset, parse_page, split, stream
+from modules.Responses import abort, send
+from modules.RESTful_Builder import Builder, query_budget, read_only, requested_fields
 from modules.Tariffs import get_tariff
+from http_validators import conditional, table_key, user_key
 
 
-def send(code: int, response: dict | None = None):
-    payload = {"status": code}
-    if response is not None:
-        payload["data"] = response
-    return jsonify(payload), code
+def uuid() -> str:
+    return uuid4().hex
 
 
-def abort(code: int, message: str):
-    return (
-        jsonify(
-            {"status": code, "error": HTTPStatus(code).phrase, "message": message}
+# The token's tariff was removed from the catalog by a reload.
+TARIFF_UNAVAILABLE = "Tariff no longer available, choose another one."
+
+TICKET_FIELDS = ("uuid", "showing", "tariff", "price_cents")
+OWNED_FIELDS = (*TICKET_FIELDS, "user_id")
+_SHOWING_COLUMNS = (
+    Ticket.showing_id,
+    Ticket.showing_start,
+    Ticket.showing_room,
+    Ticket.showing,
+)
+
+
+def _ticket_columns(fields: list[str]):
+    """Load only the columns of the selected fields (and the uuid, for paging)."""
+    return load_only(
+        Ticket.uuid,
+        *(
+            column
+            for field in fields
+            for column in (
+                _SHOWING_COLUMNS if field == "showing" else (getattr(Ticket, field),)
+            )
         ),
-        code,
     )
 
 
-def uuid() -> str:
-    return uuid4().hex
-
-
-def _serialize_showing(showing: dict | str) -> str:
-    if isinstance(showing, str):
-        return showing
-    return json.dumps(showing, separators=(",", ":"))
+def _ticket_payload(ticket: Ticket, fields: list[str] = TICKET_FIELDS):
+    return {
+        field: Showings.join(
+            ticket.showing_id,
+            ticket.showing_start,
+            ticket.showing_room,
+            ticket.showing,
+        )
+        if field == "showing"
+        else getattr(ticket, field)
+        for field in fields
+    }
 
 
-def _deserialize_showing(showing: str | dict):
-    if not isinstance(showing, str):
-        return showing
+def _showing_filters(args) -> list:
+    """SQL filters of `scope=all` listings: `showing` id, `from` and `to` start dates."""
+    filters = []
+    if args.get("showing"):
+        filters.append(Ticket.showing_id == args["showing"])
     try:
-        return json.loads(showing)
-    except json.JSONDecodeError:
-        return showing
+        if args.get("from"):
+            filters.append(Ticket.showing_start >= Showings.parse_start(args["from"]))
+        if args.get("to"):
+            filters.append(Ticket.showing_start < Showings.parse_start(args["to"]))
+    except ValueError:
+        raise ValueError("Invalid value: from/to (ISO 8601 dates with a UTC offset)") from None
+    return filters
 
 
-def _ticket_payload(ticket: Ticket, include_owner: bool = False):
-    payload = {
-        "uuid": ticket.uuid,
-        "showing": _deserialize_showing(ticket.showing),
-        "tariff": ticket.tariff,
-        "price_cents": ticket.price_cents,
-    }
-    if include_owner:
-        payload["user_id"] = ticket.user_id
-    return payload
+def _listing_key() -> list[str]:
+    if request.args.get("scope") == "all":
+        return table_key("tickets")()
+    return user_key()
 
 
-@jwt_required()
+@query_budget(4)
+@read_only
+@claims_required()
+@conditional(_listing_key)
 def getAll():
     identity = get_jwt_identity()
     scope = request.args.get("scope")
 
     with get_session() as session:
         if scope == "all":
-            current = session.get(User, identity)
-            if current is None:
-                return abort(404, "User not found.")
-            if current.role != "admin":
+            if current_claims()["role"] != "admin":
                 return abort(403, "Admin role required.")
 
-            tickets = session.execute(select(Ticket)).scalars().all()
-            reservations = [
-                _ticket_payload(ticket, include_owner=True) for ticket in tickets
-            ]
-            return send(200, {"tickets": reservations})
+            try:
+                page = parse_page(request.args)
+                filters = _showing_filters(request.args)
+                fields = requested_fields(OWNED_FIELDS)
+            except ValueError as exc:
+                return abort(400, str(exc))
+            serialize = partial(_ticket_payload, fields=fields)
+
+            stmt = keyset(
+                select(Ticket).options(_ticket_columns(fields)).where(*filters),
+                Ticket.uuid,
+                page,
+            )
+            if page.stream:
+                return stream(get_session, stmt, "tickets", serialize, page)
+
+            tickets, next_cursor = split(
+                session.scalars(stmt).all(), page, lambda ticket: ticket.uuid
+            )
+            reservations = [serialize(ticket) for ticket in tickets]
+            return send(200, {"tickets": reservations, "next_cursor": next_cursor})
 
+        try:
+            fields = requested_fields(TICKET_FIELDS)
+        except ValueError as exc:
+            return abort(400, str(exc))
         tickets = session.scalars(
-            select(Ticket).where(Ticket.user_id == identity)
+            select(Ticket)
+            .options(_ticket_columns(fields))
+            .where(Ticket.user_id == identity)
+            .order_by(Ticket.showing_start)
         ).all()
-        reservations = [_ticket_payload(ticket) for ticket in tickets]
+        reservations = [_ticket_payload(ticket, fields) for ticket in tickets]
 
     if not reservations:
         return abort(404, "No tickets were found.")
@@ -90,45 +137,69 @@ def getAll():
     return send(200, {"tickets": reservations})
 
 
+@query_budget(4)
+@read_only
 @jwt_required()
+@conditional(user_key)
 def getOne(id: str):
     identity = get_jwt_identity()
+    try:
+        fields = requested_fields(TICKET_FIELDS)
+    except ValueError as exc:
+        return abort(400, str(exc))
 
     with get_session() as session:
         ticket = session.scalar(
-            select(Ticket).where(Ticket.uuid == id, Ticket.user_id == identity)
+            select(Ticket)
+            .options(_ticket_columns(fields))
+            .where(Ticket.uuid == id, Ticket.user_id == identity)
         )
 
     if ticket is None:
         return abort(404, f"The specified ticket was not found ({id}).")
 
-    return send(200, {"ticket": _ticket_payload(ticket)})
+    return send(200, {"ticket": _ticket_payload(ticket, fields)})
 
 
-@jwt_required()
+@claims_required()
 def create():
     identity = get_jwt_identity()
 
     showing = request.json.get("showing")
     if showing is None:
         return abort(400, "Missing value: showing")
-    if not isinstance(showing, (dict, str)):
-        return abort(400, "Invalid value: showing")
+    try:
+        columns = Showings.split(showing)
+    except ValueError as exc:
+        return abort(400, str(exc))
 
+    try:
+        tariff = get_tariff(current_claims()["tariff"])
+    except KeyError:
+        return abort(409, TARIFF_UNAVAILABLE)
+
+    ticket_uuid = uuid()
+    values = {
+        "uuid": ticket_uuid,
+        **columns,
+        "tariff": tariff.code,
+        "price_cents": tariff.price_cents,
+    }
+    table = Ticket.__table__
+
+    # INSERT ... SELECT: one statement, and no row if the user is gone.
     with get_session() as session:
-        user = session.get(User, identity)
-        if user is None:
-            return abort(404, "User not found.")
-        tariff = get_tariff(user.tariff)
-        ticket = Ticket(
-            uuid=uuid(),
-            showing=_serialize_showing(showing),
-            user_id=identity,
-            tariff=tariff.code,
-            price_cents=tariff.price_cents,
+        result = session.execute(
+            insert(Ticket).from_select(
+                [*values, "user_id"],
+                select(
+                    *(literal(value, table.c[name].type) for name, value in values.items()),
+                    User.uuid,
+                ).where(User.uuid == identity),
+            )
         )
-        ticket_uuid = ticket.uuid
-        session.add(ticket)
+        if result.rowcount == 0:
+            return abort(404, "User not found.")
 
     return send(
         201,
@@ -141,6 +212,75 @@ def create():
     )
 
 
+@claims_required()
+def batch():
+    identity = get_jwt_identity()
+
+    showings = request.json.get("showings")
+    atomic = request.json.get("atomic", True)
+    if showings is None:
+        return abort(400, "Missing value: showings")
+    if not isinstance(showings, list) or not showings:
+        return abort(400, "Invalid value: showings")
+    if len(showings) > settings.ticket_batch_max:
+        return abort(
+            400, f"Too many showings (at most {settings.ticket_batch_max})."
+        )
+    if not isinstance(atomic, bool):
+        return abort(400, "Invalid value: atomic")
+
+    # One tariff for the whole batch, even if the catalog is reloaded meanwhile.
+    try:
+        tariff = get_tariff(current_claims()["tariff"])
+    except KeyError:
+        return abort(409, TARIFF_UNAVAILABLE)
+
+    rows = []
+    accepted = []
+    errors = []
+    for index, showing in enumerate(showings):
+        try:
+            columns = Showings.split(showing)
+        except ValueError as exc:
+            errors.append({"index": index, "message": str(exc)})
+            continue
+        ticket_uuid = uuid()
+        rows.append(
+            {
+                "uuid": ticket_uuid,
+                **columns,
+                "user_id": identity,
+                "tariff": tariff.code,
+                "price_cents": tariff.price_cents,
+            }
+        )
+        accepted.append({"index": index, "uuid": ticket_uuid})
+
+    if errors and (atomic or not rows):
+        return abort(400, "Some showings are invalid.", errors=errors)
+
+    with get_session() as session:
+        # The shared lock keeps the user from being deleted until the tickets are committed.
+        user = session.scalar(
+            select(User.uuid).where(User.uuid == identity).with_for_update(read=True)
+        )
+        if user is None:
+            return abort(404, "User not found.")
+        session.execute(insert(Ticket), rows)
+
+    return send(
+        201,
+        {
+            "message": "Tickets successfully created.",
+            "tickets": accepted,
+            "tariff": tariff.code,
+            "price_cents": tariff.price_cents,
+            "total_cents": tariff.price_cents * len(rows),
+            "errors": errors,
+        },
+    )
+
+
 @jwt_required()
 def delete(id: str | None = None):
     identity = get_jwt_identity()
@@ -170,5 +310,6 @@ bp = Builder("v1-tickets").bind(
     getAll=getAll,
     getOne=getOne,
     create=create,
+    batch=batch,
     delete=delete,
 ).bp
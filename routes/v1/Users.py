@@ -1,126 +1,341 @@
-from cryptography.fernet import Fernet, InvalidToken
-from flask import jsonify, request
+from flask import request
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
     get_jwt_identity,
     jwt_required,
 )
-from dotenv import load_dotenv
+from functools import partial
 from hashlib import sha256
-from http import HTTPStatus
-from os import getenv
+from math import ceil
+from os import getpid
+from threading import Lock, Thread
+from time import sleep
 from uuid import uuid4
 
-from sqlalchemy import select
-
-from database import get_session
-from models import User
-from modules.Hasher import Hasher
+from sqlalchemy import delete as sql_delete, func, insert, not_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+
+from auth import claims_for, claims_required, forget_claims, update_claims
+from config import settings
+from database import engine, get_session, on_commit, release_connections
+from migrations import compact_pending
+from models import MAX_PII_BYTES, PROFILE, SearchToken, User, user_fields
+from modules.Cache import Generations, TTLCache, VersionedCache
+from modules.Crypto import BlindIndex, Cipher, Reencryptor
+from modules.Hasher import Hasher, HashPool, RehashQueue
+from modules.Hasher.calibrate import resolve_profile
+from modules.Pagination import keyset, parse_page, split, stream
+from modules.Responses import abort, send
 from modules.Tariffs import DEFAULT_TARIFF, get_tariff
-from modules.RESTful_Builder import Builder
+from modules.Throttle import LoginThrottle, MemoryStore, RedisStore
+from modules.RESTful_Builder import Builder, query_budget, read_only, requested_fields
+from http_validators import conditional, table_key, user_key
 
 
-load_dotenv(".env")
-_key = getenv("KEY")
-if not _key:
+if not settings.encryption_key:
     raise RuntimeError("Environment variable KEY must be set for encryption.")
-KEY = _key
+CIPHER = Cipher(settings.encryption_key, settings.previous_encryption_keys)
+REENCRYPTOR = Reencryptor(
+    CIPHER,
+    get_session,
+    User,
+    key="uuid",
+    columns=["lastname", "firstname", "age", "email"],
+)
+# Admin search is disabled without BLIND_INDEX_KEY.
+BLIND_INDEX = (
+    BlindIndex(settings.blind_index_key, min_prefix=settings.blind_index_min_prefix)
+    if settings.blind_index_key
+    else None
+)
+PREFIX_SEARCH = BLIND_INDEX is not None and settings.blind_index_prefixes
+SEARCHABLE = ("lastname", "firstname", "email")
+
+HASH_PARAMS = resolve_profile(settings.hash_profile, settings.hash_profile_path)
+HASHER = Hasher(
+    params=HASH_PARAMS,
+    pool=HashPool(
+        memory_budget_kib=settings.hash_memory_budget_mib * 1024,
+        queue_size=settings.hash_queue_size,
+        queue_timeout=settings.hash_queue_timeout,
+        max_workers=settings.hash_workers or None,
+        job_memory_kib=HASH_PARAMS.memory_cost,
+    )
+    if settings.hash_memory_budget_mib > 0
+    else None
+)
 
-HASHER = Hasher()
 
+# Formatted (decrypted) profiles served by getMe. Plaintexts stay in the
+# process; with REDIS_URL, only generation counters are shared so that an
+# invalidation reaches every worker.
+PROFILE_CACHE = VersionedCache(
+    TTLCache(
+        ttl=settings.profile_cache_ttl,
+        maxsize=settings.profile_cache_size,
+        maxbytes=settings.profile_cache_mib * 1024 * 1024,
+        sweep_interval=min(settings.profile_cache_ttl, 5),
+    ),
+    Generations(settings.redis_url, "profile:", settings.profile_cache_ttl)
+    if settings.redis_url
+    else None,
+)
 
-def send(code: int, response: dict | None = None):
-    payload = {"status": code}
-    if response is not None:
-        payload["data"] = response
-    return jsonify(payload), code
 
+THROTTLE = LoginThrottle(
+    RedisStore(settings.redis_url, window=settings.login_failure_window)
+    if settings.redis_url
+    else MemoryStore(window=settings.login_failure_window),
+    ip_per_minute=settings.login_ip_per_minute,
+    ip_burst=settings.login_ip_burst,
+    account_per_minute=settings.login_account_per_minute,
+    account_burst=settings.login_account_burst,
+    backoff_base=settings.login_backoff_base,
+    backoff_max=settings.login_backoff_max,
+)
 
-def abort(code: int, message: str):
-    return (
-        jsonify(
-            {"status": code, "error": HTTPStatus(code).phrase, "message": message}
-        ),
-        code,
-    )
 
+def _persist_rehash(user_id: str, old_hash: str, new_hash: str) -> bool:
+    with get_session() as session:
+        result = session.execute(
+            update(User)
+            .where(User.uuid == user_id, User.password == old_hash)
+            .values(password=new_hash)
+        )
+        return result.rowcount == 1
 
-def uuid() -> str:
-    return uuid4().hex
 
+REHASH_QUEUE = RehashQueue(
+    HASHER,
+    _persist_rehash,
+    mode=settings.rehash_mode,
+    size=settings.rehash_queue_size,
+    attempts=settings.rehash_attempts,
+)
 
-def checkKey() -> None:
-    k = KEY.encode("utf-8")
-    try:
-        Fernet(k)
-    except ValueError as exc:
-        raise KeyError(
-            "The key is not in a valid format. (32 Bytes URL-Safe Encoded Base64)"
-        ) from exc
+
+def rehash_stats() -> dict[str, int | str]:
+    """Rehash queue counters plus the number of hashes left on other profiles."""
+    with get_session() as session:
+        remaining = session.scalar(
+            select(func.count())
+            .select_from(User)
+            .where(not_(User.password.startswith(HASHER.phc_prefix())))
+        )
+    return {**REHASH_QUEUE.stats(), "remaining": remaining}
 
 
-def _get_cipher() -> Fernet:
-    checkKey()
-    return Fernet(KEY.encode("utf-8"))
+def uuid() -> str:
+    return uuid4().hex
 
 
 def encrypt(message: str | int | float | bool) -> str:
     """Encrypt values by casting them to strings first."""
-    cipher = _get_cipher()
-    plaintext = str(message)
-    return cipher.encrypt(plaintext.encode("utf-8")).decode("utf-8")
+    return CIPHER.encrypt(message)
 
 
 def decrypt(message: str) -> str | None:
-    cipher = _get_cipher()
-    try:
-        return cipher.decrypt(message.encode("utf-8")).decode("utf-8")
-    except InvalidToken:
+    return CIPHER.decrypt(message)
+
+
+# Whether `migrations.py compact prepare` ran: checked at startup, then once a
+# minute by a background thread, so requests never touch the schema.
+_COMPACT_INTERVAL = 60
+_compact_pending = False
+_compact_lock = Lock()
+_compact_pid: int | None = None
+
+
+def refresh_compact_pending() -> bool:
+    """Check (on its own connection) whether the database is being converted to compact storage."""
+    global _compact_pending
+    with engine.connect() as connection:
+        _compact_pending = compact_pending(connection)
+    return _compact_pending
+
+
+def _watch_compact() -> None:
+    while True:
+        sleep(_COMPACT_INTERVAL)
+        try:
+            refresh_compact_pending()
+        except Exception:
+            pass  # keep the last known state
+
+
+def start_compact_watcher() -> None:
+    """Refresh the compact storage state periodically (once per process, threads do not survive a fork)."""
+    global _compact_pid
+    if settings.compact_storage or _compact_pid == getpid():
+        return
+    with _compact_lock:
+        if _compact_pid == getpid():
+            return
+        _compact_pid = getpid()
+        Thread(target=_watch_compact, name="compact-pending", daemon=True).start()
+
+
+def _compact_limits() -> bool:
+    """PII length is limited with COMPACT_STORAGE, and while converting to it."""
+    return settings.compact_storage or _compact_pending
+
+
+def _too_long(values: dict) -> str | None:
+    if not _compact_limits():
+        return None
+    too_long = [
+        key
+        for key, value in values.items()
+        if value is not None and len(str(value).encode("utf-8")) > MAX_PII_BYTES
+    ]
+    if not too_long:
         return None
+    return f"Value(s) too long (max {MAX_PII_BYTES} bytes): [{', '.join(too_long)}]"
 
 
-def _format_user(user: User) -> dict[str, str | None]:
+def _blind_indexes(values: dict) -> dict[str, str]:
+    """`<field>_bidx` columns of the given plaintexts."""
+    if BLIND_INDEX is None:
+        return {}
     return {
-        "uuid": user.uuid,
-        "lastname": decrypt(user.lastname),
-        "firstname": decrypt(user.firstname),
-        "age": decrypt(user.age),
-        "email": decrypt(user.email),
-        "role": user.role,
-        "tariff": user.tariff,
+        f"{field}_bidx": BLIND_INDEX.digest(field, value)
+        for field, value in values.items()
+        if value is not None
     }
 
 
-@jwt_required()
-def getAll():
-    identity = get_jwt_identity()
+def _search_tokens(user_id: str, values: dict) -> list[SearchToken]:
+    """Prefix tokens of the given plaintexts (BLIND_INDEX_PREFIXES)."""
+    if not PREFIX_SEARCH:
+        return []
+    return [
+        SearchToken(user_id=user_id, field=field, token=token)
+        for field, value in values.items()
+        if value is not None
+        for token in BLIND_INDEX.tokens(field, value)
+    ]
+
+
+USER_FIELDS = ("uuid", "lastname", "firstname", "age", "email", "role", "tariff")
+ENCRYPTED_FIELDS = ("lastname", "firstname", "age", "email")
+
+
+def _user_columns(fields: list[str]):
+    """Load only the columns of the selected fields (and the uuid, for paging)."""
+    return load_only(User.uuid, *(getattr(User, field) for field in fields))
+
+
+def _format_user(user: User, fields: list[str] = USER_FIELDS) -> dict[str, str | None]:
+    # Only the selected PII is decrypted.
+    encrypted = [field for field in ENCRYPTED_FIELDS if field in fields]
+    values = dict(
+        zip(encrypted, CIPHER.decrypt_many(getattr(user, f) for f in encrypted))
+    )
+    return {
+        field: values[field] if field in values else getattr(user, field)
+        for field in fields
+    }
+
+
+def _list_users(*filters):
+    try:
+        page = parse_page(request.args)
+        fields = requested_fields(USER_FIELDS)
+    except ValueError as exc:
+        return abort(400, str(exc))
+    serialize = partial(_format_user, fields=fields)
 
     with get_session() as session:
-        current = session.get(User, identity)
-        if current is None:
-            return abort(404, "User not found.")
-        if current.role != "admin":
-            return abort(403, "Admin role required.")
+        stmt = keyset(
+            select(User).options(_user_columns(fields)).where(*filters),
+            User.uuid,
+            page,
+        )
+        if page.stream:
+            return stream(get_session, stmt, "users", serialize, page)
 
-        users = [
-            _format_user(user)
-            for user in session.execute(select(User)).scalars().all()
-        ]
+        rows, next_cursor = split(
+            session.scalars(stmt).all(), page, lambda user: user.uuid
+        )
+        users = [serialize(user) for user in rows]
 
-    return send(200, {"users": users})
+    return send(200, {"users": users, "next_cursor": next_cursor})
 
 
+@query_budget(4)
+@read_only
+@claims_required(role="admin")
+@conditional(table_key("users"))
+def getAll():
+    return _list_users()
+
+
+@query_budget(4)
+@read_only
+@claims_required(role="admin")
+@conditional(table_key("users"))
+def search():
+    if BLIND_INDEX is None:
+        return abort(503, "Search is not configured (BLIND_INDEX_KEY).")
+
+    filters = [
+        getattr(User, f"{field}_bidx") == BLIND_INDEX.digest(field, request.args[field])
+        for field in SEARCHABLE
+        if request.args.get(field)
+    ]
+    query = request.args.get("q")
+    if query:
+        if not PREFIX_SEARCH:
+            return abort(400, "Prefix search is disabled (BLIND_INDEX_PREFIXES).")
+        for word in BLIND_INDEX.words(query):
+            tokens = [BLIND_INDEX.prefix(field, word) for field in SEARCHABLE]
+            if None in tokens:
+                return abort(
+                    400,
+                    f"Search words need at least {BLIND_INDEX.min_prefix} characters.",
+                )
+            filters.append(
+                User.uuid.in_(
+                    select(SearchToken.user_id).where(SearchToken.token.in_(tokens))
+                )
+            )
+    if not filters:
+        return abort(400, f"At least one of [{', '.join(SEARCHABLE)}, q] is required.")
+
+    return _list_users(*filters)
+
+
+# Not read-only: a miss reads the primary, so a lagging replica row is never cached.
+@query_budget(4)
 @jwt_required()
+@conditional(user_key)
 def getMe():
     identity = get_jwt_identity()
+    try:
+        fields = requested_fields(USER_FIELDS)
+    except ValueError as exc:
+        return abort(400, str(exc))
 
+    generation = PROFILE_CACHE.generation(identity)
+    profile = PROFILE_CACHE.get(identity, generation)
+    if profile is not None:
+        return send(200, {field: profile[field] for field in fields})
+
+    # Only whole profiles are cached, a partial one decrypts just what was asked.
+    complete = len(fields) == len(USER_FIELDS)
     with get_session() as session:
-        user = session.get(User, identity)
+        user = session.get(
+            User, identity, options=[PROFILE if complete else _user_columns(fields)]
+        )
         if user is None:
             return abort(404, "User not found.")
+        profile = _format_user(user, fields)
+    if complete:
+        PROFILE_CACHE.set(identity, profile, generation)
 
-        return send(200, _format_user(user))
+    return send(200, profile)
 
 
 def create():
@@ -152,32 +367,52 @@ def create():
         return abort(400, str(exc))
 
     email_clean = email.strip()  # type: ignore[union-attr]
+    too_long = _too_long(
+        {"lastname": lastname, "firstname": firstname, "age": age, "email": email_clean}
+    )
+    if too_long:
+        return abort(400, too_long)
     email_hash = sha256(email_clean.lower().encode("utf-8")).hexdigest()
 
+    # Duplicates are rejected before any Argon2 work, and no connection is held
+    # while hashing. The unique email_hash index still catches concurrent sign-ups.
     with get_session() as session:
-        existing = session.scalar(
-            select(User.uuid).where(User.email_hash == email_hash)
-        )
-        if existing:
-            return abort(409, "Account already exists.")
-
-        user = User(
-            uuid=uuid(),
-            lastname=encrypt(lastname),  # type: ignore[arg-type]
-            firstname=encrypt(firstname),  # type: ignore[arg-type]
-            age=encrypt(age),  # type: ignore[arg-type]
-            email=encrypt(email_clean),
-            email_hash=email_hash,
-            password=HASHER.hash(password),  # type: ignore[arg-type]
-            role=role,
-            tariff=tariff.code,
-        )
-        session.add(user)
+        taken = session.scalar(select(User.uuid).where(User.email_hash == email_hash))
+    if taken is not None:
+        return abort(409, "Account already exists.")
+    release_connections()
+
+    enc_lastname, enc_firstname, enc_age, enc_email = CIPHER.encrypt_many(
+        (lastname, firstname, age, email_clean)  # type: ignore[arg-type]
+    )
+    searchable = {"lastname": lastname, "firstname": firstname, "email": email_clean}
+    password_hash = HASHER.hash(password)  # type: ignore[arg-type]
+    user_id = uuid()
+
+    try:
+        with get_session() as session:
+            session.execute(
+                insert(User).values(
+                    uuid=user_id,
+                    lastname=enc_lastname,
+                    firstname=enc_firstname,
+                    age=enc_age,
+                    email=enc_email,
+                    email_hash=email_hash,
+                    password=password_hash,
+                    role=role,
+                    tariff=tariff.code,
+                    **_blind_indexes(searchable),
+                )
+            )
+            session.add_all(_search_tokens(user_id, searchable))
+    except IntegrityError:
+        return abort(409, "Account already exists.")
 
     return send(201, {"message": "User successfully created."})
 
 
-@jwt_required()
+@claims_required()
 def modify(_id: str | None = None):
     identity = get_jwt_identity()
 
@@ -189,7 +424,22 @@ def modify(_id: str | None = None):
     role = request.json.get("role")
     tariff_value = request.json.get("tariff")
 
-    updates: dict[str, str] = {}
+    too_long = _too_long(
+        {"lastname": lastname, "firstname": firstname, "age": age, "email": email}
+    )
+    if too_long:
+        return abort(400, too_long)
+
+    searchable = {
+        field: value
+        for field, value in (
+            ("lastname", lastname),
+            ("firstname", firstname),
+            ("email", email.strip() if email is not None else None),
+        )
+        if value is not None
+    }
+    updates: dict[str, str] = _blind_indexes(searchable)
     if lastname is not None:
         updates["lastname"] = encrypt(lastname)
     if firstname is not None:
@@ -203,6 +453,7 @@ def modify(_id: str | None = None):
         ).hexdigest()
         updates["email"] = encrypt(email_clean)
     if password is not None:
+        release_connections()  # the claims check may have used one
         updates["password"] = HASHER.hash(password)
     if role is not None:
         if role not in {"user", "admin"}:
@@ -214,30 +465,62 @@ def modify(_id: str | None = None):
         except KeyError as exc:
             return abort(400, str(exc))
         updates["tariff"] = tariff.code
+    claims_changed = "role" in updates or "tariff" in updates
+    if claims_changed:
+        # Monotonic: a token issued before any change never becomes valid again.
+        updates["claims_version"] = User.claims_version + 1
 
     if not updates:
         return abort(400, "At least one field is required.")
 
-    with get_session() as session:
-        user = session.get(User, identity)
-        if user is None:
-            return abort(404, "User not found.")
-
-        for field, value in updates.items():
-            setattr(user, field, value)
-
-    return send(200, {"message": "User successfully modified."})
+    try:
+        with get_session() as session:
+            result = session.execute(
+                update(User).where(User.uuid == identity).values(**updates)
+            )
+            if result.rowcount == 0:
+                return abort(404, "User not found.")
+            on_commit(session, lambda: PROFILE_CACHE.invalidate(identity))
+            if claims_changed:
+                # Tokens carrying an older version are rejected once this commits.
+                user = user_fields(session, identity, User.role, User.tariff, User.claims_version)
+                new_claims = claims_for(user.role, user.tariff, user.claims_version)
+                on_commit(session, partial(update_claims, identity, user.role, user.tariff, user.claims_version))
+
+            if PREFIX_SEARCH and searchable:
+                session.execute(
+                    sql_delete(SearchToken).where(
+                        SearchToken.user_id == identity,
+                        SearchToken.field.in_(searchable),
+                    )
+                )
+                session.add_all(_search_tokens(identity, searchable))
+    except IntegrityError:
+        return abort(409, "Email already used by another account.")
+
+    if not claims_changed:
+        return send(200, {"message": "User successfully modified."})
+
+    # Hand out a token with the new claims, the old ones are outdated.
+    access = create_access_token(
+        identity=identity, fresh=False, additional_claims=new_claims
+    )
+    return send(
+        200,
+        {"message": "User successfully modified.", "token": {"access": access}},
+    )
 
 
 @jwt_required()
-def delete():
+def delete(_id: str | None = None):
     identity = get_jwt_identity()
 
     with get_session() as session:
-        user = session.get(User, identity)
-        if user is None:
+        result = session.execute(sql_delete(User).where(User.uuid == identity))
+        if result.rowcount == 0:
             return abort(404, "User not found.")
-        session.delete(user)
+        on_commit(session, lambda: PROFILE_CACHE.invalidate(identity))
+        on_commit(session, lambda: forget_claims(identity))
 
     return send(200, {"message": "User successfully deleted."})
 
@@ -254,27 +537,42 @@ def login():
     email_clean = email.strip()  # type: ignore[union-attr]
     email_hash = sha256(email_clean.lower().encode("utf-8")).hexdigest()
 
-    with get_session() as session:
-        user = session.scalar(select(User).where(User.email_hash == email_hash))
-        if user is None:
-            return abort(401, "Email or password invalid.")
-
-        decrypted_email = decrypt(user.email)
-        if decrypted_email != email_clean:
-            return abort(401, "Email or password invalid.")
+    # Before any Argon2 work: throttled attempts must stay cheap.
+    retry_after = THROTTLE.check(request.remote_addr, email_hash)
+    if retry_after:
+        return abort(
+            429,
+            "Too many login attempts, retry later.",
+            headers={"Retry-After": str(ceil(retry_after))},
+        )
 
-        password_valid, new_password = HASHER.verify_and_rehash(
-            user.password, password  # type: ignore[arg-type]
+    with get_session() as session:
+        user = session.scalar(
+            select(User)
+            .options(
+                load_only(
+                    User.uuid, User.email, User.password, User.role, User.tariff,
+                    User.claims_version,
+                )
+            )
+            .where(User.email_hash == email_hash)
         )
-        if not password_valid:
+        if (
+            user is None
+            or decrypt(user.email) != email_clean
+            or not HASHER.verify(user.password, password)  # type: ignore[arg-type]
+        ):
+            THROTTLE.failed(email_hash)
             return abort(401, "Email or password invalid.")
-
-        if new_password != user.password:
-            user.password = new_password
+        THROTTLE.succeeded(email_hash)
 
         identity = user.uuid
+        claims = claims_for(user.role, user.tariff, user.claims_version)
+        REHASH_QUEUE.submit(identity, user.password, password)  # type: ignore[arg-type]
 
-    access = create_access_token(identity=identity, fresh=True)
+    access = create_access_token(
+        identity=identity, fresh=True, additional_claims=claims
+    )
     refresh = create_refresh_token(identity=identity)
 
     return send(
@@ -290,7 +588,16 @@ def login():
 def refresh():
     identity = get_jwt_identity()
 
-    access = create_access_token(identity=identity, fresh=False)
+    with get_session() as session:
+        user = user_fields(session, identity, User.role, User.tariff, User.claims_version)
+    if user is None:
+        return abort(404, "User not found.")
+
+    access = create_access_token(
+        identity=identity,
+        fresh=False,
+        additional_claims=update_claims(identity, user.role, user.tariff, user.claims_version),
+    )
 
     return send(200, {"token": {"access": access}})
 
@@ -299,6 +606,7 @@ bp = Builder("v1-users").bind(
     login=login,
     refresh=refresh,
     getAll=getAll,
+    search=search,
     getMe=getMe,
     create=create,
     modify=modify,
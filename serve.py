@@ -0,0 +1,132 @@
+from os import cpu_count
+from tempfile import mkdtemp
+
+from gunicorn.app.base import BaseApplication
+
+from config import settings
+
+
+_CGROUP_LIMITS = (
+    "/sys/fs/cgroup/memory.max",  # cgroup v2
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",  # cgroup v1
+)
+
+
+def memory_limit_mib() -> int:
+    """Memory available to the service (MEMORY_LIMIT_MIB, else the container limit, 0 if unknown)."""
+    if settings.memory_limit_mib:
+        return settings.memory_limit_mib
+    for path in _CGROUP_LIMITS:
+        try:
+            with open(path, encoding="utf-8") as file:
+                value = file.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    return 0
+
+
+def _hash_params():
+    from modules.Hasher.calibrate import resolve_profile
+
+    return resolve_profile(settings.hash_profile, settings.hash_profile_path)
+
+
+def hash_memory_mib() -> int:
+    """Worst-case Argon2 memory of one worker."""
+    if settings.hash_memory_budget_mib > 0:
+        return settings.hash_memory_budget_mib
+    # Without a pool, every thread may be hashing at the same time.
+    return settings.threads * _hash_params().memory_cost // 1024
+
+
+def hash_processes() -> int:
+    """Argon2 processes started by one worker: its pool plus the forkserver."""
+    if settings.hash_memory_budget_mib <= 0:
+        return 0
+    from modules.Hasher.pool import pool_size
+
+    size = settings.hash_workers or pool_size(settings.hash_memory_budget_mib * 1024, _hash_params().memory_cost)
+    return size + 1
+
+
+def worker_count() -> int:
+    """Workers to start: WORKERS (or 2 * CPU + 1), capped so Argon2 cannot exhaust the memory limit."""
+    requested = settings.workers or (cpu_count() or 1) * 2 + 1
+    limit = memory_limit_mib()
+    if not limit:
+        return requested
+    per_worker = settings.worker_memory_mib + hash_memory_mib() + hash_processes() * settings.hash_process_memory_mib
+    return max(1, min(requested, limit // per_worker))
+
+
+def post_fork(server, worker) -> None:
+    # Connections inherited from the preloading master must not be shared.
+    from database import engine, replica_engines
+
+    for pooled in (engine, *replica_engines):
+        pooled.dispose(close=False)
+
+
+def worker_exit(server, worker) -> None:
+    # Keep the last requests of a recycled worker (MAX_REQUESTS) in the totals.
+    histograms = worker.wsgi.extensions.get("metrics")
+    if histograms is not None:
+        histograms.flush()
+
+
+def prepare_metrics() -> None:
+    """Share the latency histograms between workers (METRICS_DIR, else a temporary directory)."""
+    from modules.Metrics import reset_directory
+
+    if not settings.metrics:
+        return
+    if not settings.metrics_dir:
+        settings.metrics_dir = mkdtemp(prefix="metrics-")
+    reset_directory(settings.metrics_dir)
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict) -> None:
+        """Gunicorn server preloading the Flask application.
+
+        :param dict options: Gunicorn settings
+        """
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import create_app
+
+        return create_app()
+
+
+def options() -> dict:
+    return {
+        "bind": f"{settings.host}:{settings.port}",
+        "workers": worker_count(),
+        "threads": settings.threads,
+        "worker_class": "gthread" if settings.threads > 1 else "sync",
+        "preload_app": True,
+        "post_fork": post_fork,
+        "worker_exit": worker_exit,
+        "timeout": settings.worker_timeout,
+        "graceful_timeout": settings.graceful_timeout,
+        "keepalive": settings.keepalive,
+        "max_requests": settings.max_requests,
+        "max_requests_jitter": settings.max_requests // 10,
+        "accesslog": "-",
+    }
+
+
+if __name__ == "__main__":
+    prepare_metrics()
+    config = options()
+    # The application is loaded after sizing, it sees the actual number of workers.
+    settings.workers = config["workers"]
+    Server(config).run()
@@ -0,0 +1,46 @@
+"""Application on a throwaway SQLite database, configured before anything is imported."""
+
+import os
+from tempfile import mkdtemp
+
+import pytest
+from cryptography.fernet import Fernet
+
+os.environ.update(
+    DB_QUERY_ACCOUNTING="raise",
+    DB_AUTO_MIGRATE="false",
+    HASH_MEMORY_BUDGET_MIB="0",
+    METRICS="false",
+    HTTP_VALIDATORS="on",
+    INTERNAL_TOKEN="internal-test-token",
+    KEY=Fernet.generate_key().decode("ascii"),
+)
+
+from config import Settings  # noqa: E402
+
+DATABASE = os.path.join(mkdtemp(), "accounts.db")
+Settings.database_url = property(lambda self: f"sqlite:///{DATABASE}")
+
+from main import create_app  # noqa: E402
+
+APP = create_app()
+
+
+@pytest.fixture
+def client():
+    return APP.test_client()
+
+
+def signup(client, email: str, password: str = "correct horse") -> dict:
+    """Create an account and log in, returns the authorization headers."""
+    user = {
+        "lastname": "Doe",
+        "firstname": "Jane",
+        "age": 30,
+        "email": email,
+        "password": password,
+    }
+    assert client.post("/v1/user/", json=user).status_code == 201
+    login = client.post("/v1/user/login", json=user)
+    assert login.status_code == 200
+    return {"Authorization": f"Bearer {login.json['data']['token']['access']}"}
@@ -0,0 +1,69 @@
+import pytest
+
+from modules import Cache
+from modules.Cache import TTLCache, VersionedCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(Cache, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("a", 1)
+    clock[0] += 9
+    assert cache.get("a") == 1
+    clock[0] += 1
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_reset_entry_gets_a_new_deadline(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("a", 1)
+    clock[0] += 5
+    cache.set("a", 2)
+    clock[0] += 6
+    assert cache.get("a") == 2
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget(clock):
+    cache = TTLCache(ttl=10, maxbytes=10, sizeof=len)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert cache.get("a") is None and cache.get("b") == "y" * 6
+    cache.set("c", "z" * 11)  # larger than the whole budget: not cached
+    assert cache.get("c") is None
+    assert cache.stats()["bytes"] == 6
+
+
+def test_invalidation_drops_the_entry():
+    cache = VersionedCache(TTLCache(ttl=10))
+    generation = cache.generation("user")
+    cache.set("user", "profile", generation)
+    assert cache.get("user", cache.generation("user")) == "profile"
+    cache.invalidate("user")
+    assert cache.get("user", cache.generation("user")) is None
+
+
+def test_value_loaded_before_an_invalidation_is_not_cached():
+    cache = VersionedCache(TTLCache(ttl=10))
+    generation = cache.generation("user")
+    cache.invalidate("user")  # a write commits while the value is being loaded
+    cache.set("user", "stale", generation)
+    assert cache.get("user", cache.generation("user")) is None
+    assert cache.get("user", generation) is None
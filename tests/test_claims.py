@@ -0,0 +1,20 @@
+"""Tokens issued before a role/tariff change stay rejected, even once the change is undone."""
+
+from conftest import signup
+
+
+def _bearer(response) -> dict:
+    return {"Authorization": f"Bearer {response.json['data']['token']['access']}"}
+
+
+def test_old_token_stays_outdated(client):
+    original = signup(client, "claims@example.com")
+
+    student = _bearer(client.patch("/v1/user/me", json={"tariff": "student"}, headers=original))
+    assert client.get("/v1/ticket/", headers=original).status_code == 401
+
+    standard = _bearer(client.patch("/v1/user/me", json={"tariff": "standard"}, headers=student))
+    # Current token: authorized, the user simply has no tickets yet.
+    assert client.get("/v1/ticket/", headers=standard).status_code == 404
+    assert client.get("/v1/ticket/", headers=student).status_code == 401
+    assert client.get("/v1/ticket/", headers=original).status_code == 401
@@ -0,0 +1,13 @@
+from routes.v1 import Users
+
+
+def test_startup_state_is_read_without_a_request():
+    assert Users.refresh_compact_pending() is False
+
+
+def test_limits_apply_while_converting(client, monkeypatch):
+    monkeypatch.setattr(Users, "_compact_pending", True)
+    user = {"lastname": "x" * 300, "firstname": "Jane", "age": 30, "email": "long@example.com", "password": "pw"}
+    response = client.post("/v1/user/", json=user)
+    assert response.status_code == 400
+    assert "lastname" in str(response.json)
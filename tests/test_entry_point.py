@@ -0,0 +1,85 @@
+"""`python3 main.py` with the Argon2 pool: hash workers re-import the entry script."""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Only the parent gets the SQLite database: a hash worker that builds the
+# application again (MySQL settings) fails, and so does the sign-up.
+LAUNCHER = textwrap.dedent(
+    """
+    import runpy, sys
+    sys.path.insert(0, {root!r})
+    from config import Settings
+    Settings.database_url = property(lambda self: "sqlite:///{database}")
+    runpy.run_path({main!r}, run_name="__main__")
+    """
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _post(url: str, body: dict) -> int:
+    request = Request(
+        url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urlopen(request, timeout=30) as response:
+        return response.status
+
+
+def test_hash_job_from_main(tmp_path):
+    port = _free_port()
+    launcher = tmp_path / "launch.py"
+    launcher.write_text(
+        LAUNCHER.format(
+            root=str(ROOT), database=tmp_path / "accounts.db", main=str(ROOT / "main.py")
+        )
+    )
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "HASH_MEMORY_BUDGET_MIB": "256",
+        "HASH_WORKERS": "1",
+        "DB_AUTO_MIGRATE": "false",
+    }
+    server = subprocess.Popen(
+        [sys.executable, str(launcher)],
+        cwd=tmp_path,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urlopen(url + "/", timeout=1).close()
+                break
+            except URLError:
+                assert time.monotonic() < deadline, "the server did not start"
+                time.sleep(0.2)
+        user = {
+            "lastname": "Doe",
+            "firstname": "Jane",
+            "age": 30,
+            "email": "entry@example.com",
+            "password": "correct horse",
+        }
+        assert _post(url + "/v1/user/", user) == 201
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
@@ -0,0 +1,90 @@
+"""HashPool admission: memory budget, bounded FIFO queue, timeouts and dead workers."""
+
+import os
+from threading import Thread
+from time import monotonic, sleep
+
+import pytest
+
+from modules.Hasher import HashPool, HasherBusy
+
+
+def _in_background(pool: HashPool, memory_kib: int, seconds: float) -> Thread:
+    thread = Thread(target=pool.run, args=(memory_kib, sleep, seconds))
+    thread.start()
+    return thread
+
+
+def _wait_for(condition) -> None:
+    deadline = monotonic() + 10
+    while not condition():
+        assert monotonic() < deadline
+        sleep(0.01)
+
+
+@pytest.fixture
+def pool():
+    pool = HashPool(memory_budget_kib=100, queue_size=1, queue_timeout=5, max_workers=2)
+    pool.run(0, sleep, 0)  # start the workers outside of the timings
+    return pool
+
+
+def test_rejects_when_queue_is_full(pool):
+    running = _in_background(pool, 100, 0.5)
+    _wait_for(lambda: pool.stats()["running"] == 1)
+    queued = _in_background(pool, 100, 0)
+    _wait_for(lambda: pool.stats()["queued"] == 1)
+    with pytest.raises(HasherBusy) as busy:
+        pool.run(100, sleep, 0)
+    assert busy.value.retry_after >= 1
+    running.join()
+    queued.join()
+    assert pool.stats()["rejected"] == 1
+
+
+def test_times_out_in_queue(pool):
+    pool.queue_timeout = 0.1
+    running = _in_background(pool, 100, 0.5)
+    _wait_for(lambda: pool.stats()["running"] == 1)
+    with pytest.raises(HasherBusy):
+        pool.run(100, sleep, 0)
+    running.join()
+    assert pool.stats()["timed_out"] == 1
+
+
+def test_admits_in_arrival_order(pool):
+    running = _in_background(pool, 100, 0.5)
+    _wait_for(lambda: pool.stats()["running"] == 1)
+    queued = _in_background(pool, 100, 0)
+    _wait_for(lambda: pool.stats()["queued"] == 1)
+    # Would fit next to the running job, but the queued one comes first.
+    pool.queue_size = 2
+    start = monotonic()
+    pool.run(0, sleep, 0)
+    assert monotonic() - start >= 0.3
+    running.join()
+    queued.join()
+
+
+def test_dead_worker_is_busy_and_replaced(pool):
+    with pytest.raises(HasherBusy):
+        pool.run(0, os._exit, 1)
+    assert pool.run(0, abs, -1) == 1
+
+
+def test_max_workers_follow_the_budget():
+    assert HashPool(memory_budget_kib=100, job_memory_kib=50).max_workers <= 2
+    assert HashPool(memory_budget_kib=10, job_memory_kib=50).max_workers == 1
+
+
+def test_busy_is_a_503(client, monkeypatch):
+    from routes.v1.Users import HASHER
+
+    def busy(password):
+        raise HasherBusy(3)
+
+    monkeypatch.setattr(HASHER, "hash", busy)
+    user = {"lastname": "a", "firstname": "b", "age": 1, "email": "busy@example.com", "password": "p"}
+    response = client.post("/v1/user/", json=user)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
@@ -0,0 +1,20 @@
+import pytest
+
+from modules.Hasher import calibrate
+from modules.Hasher.main import CUSTOM_ARGON_PROFILE
+
+
+def test_missing_profile_is_never_calibrated(tmp_path, monkeypatch):
+    monkeypatch.setattr(calibrate, "calibrate", lambda *args, **kwargs: pytest.fail("calibrated at startup"))
+    path = tmp_path / "profiles.json"
+    with pytest.raises(RuntimeError, match="modules.Hasher calibrate"):
+        calibrate.resolve_profile("pod", str(path))
+    assert not path.exists()
+
+
+def test_saved_profile_is_versioned_and_loaded(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    assert calibrate.save_profile("pod", CUSTOM_ARGON_PROFILE, path) == 1
+    assert calibrate.save_profile("pod", CUSTOM_ARGON_PROFILE, path) == 2
+    assert calibrate.resolve_profile("pod", path) == CUSTOM_ARGON_PROFILE
+    assert calibrate.resolve_profile("", path) is CUSTOM_ARGON_PROFILE
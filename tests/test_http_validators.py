@@ -0,0 +1,27 @@
+from conftest import signup
+
+
+def test_not_modified_until_written(client):
+    headers = signup(client, "etag@example.com")
+
+    first = client.get("/v1/user/me", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    cached = client.get("/v1/user/me", headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    assert client.patch("/v1/user/me", json={"firstname": "Joan"}, headers=headers).status_code == 200
+    changed = client.get("/v1/user/me", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json["data"]["firstname"] == "Joan"
+
+
+def test_validators_are_per_user(client):
+    alice = signup(client, "alice@example.com")
+    bob = signup(client, "bob@example.com")
+    etag = client.get("/v1/user/me", headers=alice).headers["ETag"]
+    assert client.get("/v1/user/me", headers={**bob, "If-None-Match": etag}).status_code == 200
@@ -0,0 +1,18 @@
+"""Internal routes are only reachable with INTERNAL_TOKEN, wherever the request comes from."""
+
+from config import settings
+
+TOKEN = {"X-Internal-Token": "internal-test-token"}
+
+
+def test_token_required(client):
+    assert client.get("/internal/pool").status_code == 403
+    assert client.get("/internal/pool", headers={"X-Internal-Token": "wrong"}).status_code == 403
+    assert client.get("/internal/pool", headers=TOKEN).status_code == 200
+
+
+def test_disabled_without_token_even_locally(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_token", "")
+    local = {"REMOTE_ADDR": "127.0.0.1"}
+    assert client.get("/internal/pool", environ_base=local).status_code == 403
+    assert client.post("/internal/tariffs/reload", environ_base=local).status_code == 403
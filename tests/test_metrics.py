@@ -0,0 +1,44 @@
+import os
+
+from modules import Metrics
+
+
+def _count(text: str, endpoint: str) -> str:
+    prefix = f'app_request_duration_seconds_count{{endpoint="{endpoint}",method="GET"}} '
+    return next(line[len(prefix):] for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_processes_are_added_up(tmp_path):
+    directory = str(tmp_path)
+    Metrics.reset_directory(directory)
+    histograms = Metrics.Histograms(directory, flush_interval=3600)
+    histograms.observe(("request", "/a", "GET"), 0.003)
+
+    child = os.fork()
+    if child == 0:
+        # A worker forked after the first observation: it starts from zero.
+        histograms.observe(("request", "/a", "GET"), 0.2)
+        histograms.observe(("request", "/b", "GET"), 0.2)
+        histograms.flush()
+        os._exit(0)
+    _, status = os.waitpid(child, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    # The exited worker's file stays counted, the parent's live series are added.
+    text = histograms.render()
+    assert _count(text, "/a") == "2"
+    assert _count(text, "/b") == "1"
+    assert 'app_request_duration_seconds_bucket{endpoint="/a",method="GET",le="0.005"} 1' in text
+
+
+def test_phases_of_a_request():
+    histograms = Metrics.Histograms()
+    Metrics.start()
+    Metrics.add("db", 0.002)
+    with Metrics.timed("fernet"):
+        pass
+    histograms.record("/me", "GET")
+    Metrics.add("db", 1.0)  # outside of a request: ignored
+    series = histograms.snapshot()
+    assert series[("phase", "/me", "GET", "db")][-2] == 0.002
+    assert series[("request", "/me", "GET")][-1] == 1
@@ -0,0 +1,52 @@
+from json import loads
+
+import pytest
+from conftest import signup
+from modules.Pagination import Page, parse_page, split
+
+
+def test_parse_page():
+    assert parse_page({}) == Page(limit=100, cursor=None, stream=None)
+    assert parse_page({"limit": "5", "cursor": "abc", "stream": "ndjson"}) == Page(5, "abc", "ndjson")
+    for args in ({"limit": "0"}, {"limit": "x"}, {"stream": "csv"}):
+        with pytest.raises(ValueError):
+            parse_page(args)
+
+
+def test_split_trims_the_extra_row():
+    page = Page(limit=2, cursor=None, stream=None)
+    assert split([1, 2, 3], page, str) == ([1, 2], "2")
+    assert split([1, 2], page, str) == ([1, 2], None)
+
+
+@pytest.fixture
+def admin(client):
+    signup(client, "page-1@example.com")
+    signup(client, "page-2@example.com")
+    headers = signup(client, "page-3@example.com")
+    promoted = client.patch("/v1/user/me", json={"role": "admin"}, headers=headers)
+    return {"Authorization": f"Bearer {promoted.json['data']['token']['access']}"}
+
+
+def _listing(client, admin, **params):
+    response = client.get("/v1/user/", query_string=params, headers=admin)
+    assert response.status_code == 200
+    return response
+
+
+def test_pages_and_stream_agree(client, admin):
+    pages, cursor = [], None
+    while True:
+        data = _listing(client, admin, limit=2, **({"cursor": cursor} if cursor else {})).json["data"]
+        pages.extend(user["uuid"] for user in data["users"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == sorted(pages) and len(pages) >= 3
+
+    streamed = loads(_listing(client, admin, stream="json").get_data())["data"]
+    assert [user["uuid"] for user in streamed["users"]] == pages
+    assert streamed["next_cursor"] is None
+
+    lines = _listing(client, admin, stream="ndjson", cursor=pages[0]).get_data().splitlines()
+    assert [loads(line)["uuid"] for line in lines] == pages[1:]
@@ -0,0 +1,18 @@
+"""Writes go through the query accounting listeners (DB_QUERY_ACCOUNTING=raise)."""
+
+from conftest import signup
+
+
+def test_writes_with_accounting_on(client):
+    headers = signup(client, "jane@example.com")
+
+    modified = client.patch("/v1/user/me", json={"tariff": "student"}, headers=headers)
+    assert modified.status_code == 200
+    headers = {"Authorization": f"Bearer {modified.json['data']['token']['access']}"}
+    ticket = client.post(
+        "/v1/ticket/",
+        json={"showing": {"id": "s1", "start": "2026-10-17T20:00:00+02:00"}},
+        headers=headers,
+    )
+    assert ticket.status_code == 201
+    assert client.delete("/v1/user/", headers=headers).status_code == 200
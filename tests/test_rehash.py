@@ -0,0 +1,79 @@
+"""RehashQueue: one hash per plaintext, only storing the new hash is retried."""
+
+from time import monotonic, sleep
+
+from modules.Hasher import RehashQueue
+
+
+class FakeHasher:
+    pool = None
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.hashed = 0
+
+    def needs_rehash(self, hash: str) -> bool:
+        return hash.startswith("old:")
+
+    def hash(self, password: str) -> str:
+        self.hashed += 1
+        if self.fail:
+            raise RuntimeError("hash failed")
+        return f"new:{password}"
+
+
+def _drain(queue: RehashQueue) -> dict:
+    deadline = monotonic() + 5
+    while queue.stats()["pending"]:
+        assert monotonic() < deadline
+        sleep(0.01)
+    return queue.stats()
+
+
+def test_migrates_outdated_hashes():
+    stored = {}
+
+    def persist(key, old, new):
+        stored[key] = new
+        return True
+
+    queue = RehashQueue(FakeHasher(), persist)
+    assert not queue.submit("u1", "new:pw", "pw")
+    assert queue.submit("u1", "old:pw", "pw")
+    assert _drain(queue)["migrated"] == 1
+    assert stored == {"u1": "new:pw"}
+
+
+def test_failed_hash_is_not_retried():
+    hasher = FakeHasher(fail=True)
+    queue = RehashQueue(hasher, lambda key, old, new: True, backoff=0)
+    queue.submit("u1", "old:pw", "pw")
+    stats = _drain(queue)
+    assert hasher.hashed == 1
+    assert stats["failed"] == 1 and stats["retried"] == 0
+
+
+def test_persist_is_retried_with_the_same_hash():
+    hasher = FakeHasher()
+    calls = []
+
+    def persist(key, old, new):
+        calls.append(new)
+        if len(calls) < 2:
+            raise RuntimeError("database unavailable")
+        return False  # changed meanwhile
+
+    queue = RehashQueue(hasher, persist, backoff=0)
+    queue.submit("u1", "old:pw", "pw")
+    stats = _drain(queue)
+    assert hasher.hashed == 1
+    assert calls == ["new:pw", "new:pw"]
+    assert stats["retried"] == 1 and stats["stale"] == 1
+
+
+def test_full_queue_drops(monkeypatch):
+    queue = RehashQueue(FakeHasher(), lambda key, old, new: True, size=1)
+    monkeypatch.setattr(queue, "_start", lambda: None)  # nothing consumes the queue
+    assert queue.submit("u1", "old:a", "a")
+    assert not queue.submit("u2", "old:b", "b")
+    assert queue.stats()["dropped"] == 1
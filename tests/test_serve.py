@@ -0,0 +1,16 @@
+import serve
+from config import settings
+
+
+def test_worker_count_includes_hash_processes(monkeypatch):
+    monkeypatch.setattr(settings, "workers", 16)
+    monkeypatch.setattr(settings, "memory_limit_mib", 1000)
+    monkeypatch.setattr(settings, "worker_memory_mib", 100)
+    monkeypatch.setattr(settings, "hash_memory_budget_mib", 100)
+    monkeypatch.setattr(settings, "hash_workers", 3)
+    monkeypatch.setattr(settings, "hash_process_memory_mib", 25)
+    # 100 + 100 + (3 pool processes + forkserver) * 25 = 300 MiB per worker.
+    assert serve.worker_count() == 3
+
+    monkeypatch.setattr(settings, "hash_process_memory_mib", 0)
+    assert serve.worker_count() == 5
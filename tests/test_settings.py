@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("variable", ["DB_PRE_PING", "DB_QUERY_ACCOUNTING"])
+def test_unknown_values_are_rejected(variable):
+    env = {**os.environ, variable: "sometimes"}
+    result = subprocess.run(
+        [sys.executable, "-c", "import database"], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert f"{variable} must be one of" in result.stderr
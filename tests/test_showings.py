@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pytest
+
+from modules import Showings
+
+
+def test_start_is_stored_as_naive_utc():
+    assert Showings.parse_start("2026-10-17T20:00:00+02:00") == datetime(2026, 10, 17, 18, 0)
+    assert Showings.parse_start("2026-10-17T18:00:00Z") == datetime(2026, 10, 17, 18, 0)
+
+
+def test_start_requires_an_offset():
+    with pytest.raises(ValueError, match="offset"):
+        Showings.parse_start("2026-10-17T20:00:00")
+    assert Showings.parse_start("2026-10-17T20:00:00", naive=True) == datetime(2026, 10, 17, 20, 0)
+    with pytest.raises(ValueError):
+        Showings.parse_start("tonight")
+
+
+def test_format_start_is_explicit_utc():
+    assert Showings.format_start(datetime(2026, 10, 17, 18, 0)) == "2026-10-17T18:00:00+00:00"
+
+
+def test_split_join_round_trip():
+    showing = {"id": "s1", "start": "2026-10-17T20:00:00+02:00", "room": "3", "seat": "F12"}
+    columns = Showings.split(showing)
+    assert Showings.join(
+        columns["showing_id"], columns["showing_start"], columns["showing_room"], columns["showing"]
+    ) == {**showing, "start": "2026-10-17T18:00:00+00:00"}
+
+
+def test_join_unconverted_legacy_label():
+    assert Showings.join(None, None, None, "Salle 3, 20h") == "Salle 3, 20h"
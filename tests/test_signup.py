@@ -0,0 +1,13 @@
+from conftest import signup
+from routes.v1 import Users
+
+
+def test_duplicate_is_rejected_before_hashing(client, monkeypatch):
+    signup(client, "twice@example.com")
+
+    def hash(password):
+        raise AssertionError("hashed a password for a duplicate sign-up")
+
+    monkeypatch.setattr(Users.HASHER, "hash", hash)
+    user = {"lastname": "Doe", "firstname": "Jane", "age": 30, "email": " Twice@Example.com ", "password": "pw"}
+    assert client.post("/v1/user/", json=user).status_code == 409
@@ -0,0 +1,10 @@
+def test_listing_without_trailing_slash(client):
+    for url in ("/v1/tariff", "/v1/tariff/"):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert "standard" in response.json["data"]["tariffs"]
+
+
+def test_not_modified(client):
+    etag = client.get("/v1/tariff").headers["ETag"]
+    assert client.get("/v1/tariff", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,62 @@
+import pytest
+
+from modules import Throttle
+from modules.Throttle import LoginThrottle, MemoryStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(Throttle, "time", lambda: now[0])
+    return now
+
+
+def _throttle(**kwargs) -> LoginThrottle:
+    options = dict(
+        ip_per_minute=60, ip_burst=3, account_per_minute=60, account_burst=10,
+        backoff_base=1, backoff_max=8,
+    )
+    return LoginThrottle(MemoryStore(), **{**options, **kwargs})
+
+
+def test_ip_bucket_refills(clock):
+    throttle = _throttle()
+    assert [throttle.check("1.2.3.4", f"account-{n}") for n in range(3)] == [0, 0, 0]
+    assert throttle.check("1.2.3.4", "account-3") == pytest.approx(1.0)
+    assert throttle.check("5.6.7.8", "account-3") == 0
+    clock[0] += 1
+    assert throttle.check("1.2.3.4", "account-3") == 0
+    assert throttle.stats()["rejected_ip"] == 1
+
+
+def test_account_bucket_spans_ips(clock):
+    throttle = _throttle(account_burst=2)
+    assert throttle.check("1.1.1.1", "account") == 0
+    assert throttle.check("2.2.2.2", "account") == 0
+    assert throttle.check("3.3.3.3", "account") > 0
+    assert throttle.stats()["rejected_account"] == 1
+
+
+def test_backoff_doubles_then_resets(clock):
+    throttle = _throttle()
+    for delay in (1, 2, 4, 8, 8):
+        throttle.failed("account")
+        assert throttle.check("1.1.1.1", "account") == pytest.approx(delay)
+        clock[0] += delay
+    throttle.succeeded("account")
+    throttle.failed("account")
+    assert throttle.check("1.1.1.1", "account") == pytest.approx(1)
+
+
+def test_unreachable_store_admits(monkeypatch):
+    class Unreachable(Exception):
+        pass
+
+    class Store:
+        def blocked(self, key):
+            raise Unreachable()
+
+    monkeypatch.setattr(Throttle, "_STORE_ERRORS", (Unreachable,))
+    throttle = LoginThrottle(Store(), 60, 3, 60, 10, 1, 8)
+    assert throttle.check("1.1.1.1", "account") == 0
+    assert throttle.stats()["store_errors"] == 1
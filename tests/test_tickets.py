@@ -0,0 +1,22 @@
+from flask_jwt_extended import decode_token
+
+import auth
+from conftest import APP, signup
+
+SHOWING = {"id": "s1", "start": "2026-10-17T20:00:00+02:00"}
+
+
+def test_batch_for_deleted_user_is_404(client):
+    headers = signup(client, "batch@example.com")
+    created = client.post("/v1/ticket/batch", json={"showings": [SHOWING, SHOWING]}, headers=headers)
+    assert created.status_code == 201
+    assert len(created.json["data"]["tickets"]) == 2
+
+    assert client.delete("/v1/user/", headers=headers).status_code == 200
+    # As if deleted through another worker, whose claims cache has not caught up.
+    with APP.app_context():
+        token = decode_token(headers["Authorization"].split()[1])
+    auth.CLAIMS_CACHE.set(token["sub"], token["cv"])
+    gone = client.post("/v1/ticket/batch", json={"showings": [SHOWING]}, headers=headers)
+    assert gone.status_code == 404
+    assert "User not found." in str(gone.json)